@@ -0,0 +1,66 @@
+"""initial schema
+
+Tables as create_tables() created them before migrations were introduced.
+Databases created that way are stamped with this revision on first startup.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'search_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('location', sa.String(length=255), nullable=False),
+        sa.Column('search_timestamp', sa.DateTime(), nullable=True),
+        sa.Column('user_ip', sa.String(length=45), nullable=True),
+        sa.Column('search_status', sa.String(length=50), nullable=True),
+        sa.Column('store_count', sa.Integer(), nullable=True),
+        sa.Column('response_time_ms', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'location_cache',
+        sa.Column('location_hash', sa.String(length=64), nullable=False),
+        sa.Column('location', sa.String(length=255), nullable=False),
+        sa.Column('results', sa.JSON(), nullable=True),
+        sa.Column('cached_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('location_hash')
+    )
+    op.create_table(
+        'stores',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('search_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('address', sa.Text(), nullable=True),
+        sa.Column('website', sa.String(length=500), nullable=True),
+        sa.Column('phone', sa.String(length=50), nullable=True),
+        sa.Column('place_id', sa.String(length=255), nullable=True),
+        sa.Column('latitude', sa.DECIMAL(precision=10, scale=8), nullable=True),
+        sa.Column('longitude', sa.DECIMAL(precision=11, scale=8), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['search_id'], ['search_history.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('place_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stores')
+    op.drop_table('location_cache')
+    op.drop_table('search_history')
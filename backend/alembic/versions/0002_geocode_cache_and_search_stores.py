@@ -0,0 +1,53 @@
+"""geocode cache and search_stores link table
+
+Both tables may already exist where create_tables() ran after they were added
+to models.py, so each is only created when missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Offline (--sql) mode has no database to inspect; emit both tables
+    existing = set() if op.get_context().as_sql else set(sa.inspect(op.get_bind()).get_table_names())
+    if 'geocode_cache' not in existing:
+        op.create_table(
+            'geocode_cache',
+            sa.Column('cache_key', sa.String(length=512), nullable=False),
+            sa.Column('query', sa.String(length=255), nullable=True),
+            sa.Column('latitude', sa.DECIMAL(precision=10, scale=8), nullable=True),
+            sa.Column('longitude', sa.DECIMAL(precision=11, scale=8), nullable=True),
+            sa.Column('formatted_address', sa.Text(), nullable=True),
+            sa.Column('result', sa.JSON(), nullable=True),
+            sa.Column('cached_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('cache_key')
+        )
+    if 'search_stores' not in existing:
+        op.create_table(
+            'search_stores',
+            sa.Column('search_id', sa.Integer(), nullable=False),
+            sa.Column('store_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['search_id'], ['search_history.id']),
+            sa.ForeignKeyConstraint(['store_id'], ['stores.id']),
+            sa.PrimaryKeyConstraint('search_id', 'store_id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('search_stores')
+    op.drop_table('geocode_cache')
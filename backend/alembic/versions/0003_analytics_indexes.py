@@ -0,0 +1,49 @@
+"""indexes for analytics and cache lookups
+
+- search_history.location: GROUP BY in /analytics/popular-searches
+- search_history.search_timestamp: ORDER BY in /analytics/recent-searches
+- search_history.search_status: filter in /analytics/search-stats
+- location_cache.expires_at / cached_at: expiry filter and /analytics/cached-searches order
+- stores.search_id, search_stores.store_id: foreign keys without an index
+
+Built with CREATE INDEX CONCURRENTLY on PostgreSQL so writes to large tables
+aren't blocked while they build.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_search_history_location', 'search_history', ['location']),
+    ('ix_search_history_search_timestamp', 'search_history', ['search_timestamp']),
+    ('ix_search_history_search_status', 'search_history', ['search_status']),
+    ('ix_location_cache_expires_at', 'location_cache', ['expires_at']),
+    ('ix_location_cache_cached_at', 'location_cache', ['cached_at']),
+    ('ix_stores_search_id', 'stores', ['search_id']),
+    ('ix_search_stores_store_id', 'search_stores', ['store_id']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
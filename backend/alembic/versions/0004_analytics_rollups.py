@@ -0,0 +1,53 @@
+"""analytics rollup tables
+
+search_stats_hourly and location_search_counts, backfilled from search_history
+and stores; from here on the app keeps them up to date as searches finish.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from rollups import backfill_statements
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'search_stats_hourly',
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('search_status', sa.String(length=50), nullable=False),
+        sa.Column('search_count', sa.BigInteger(), nullable=False),
+        sa.Column('stores_returned', sa.BigInteger(), nullable=False),
+        sa.Column('new_stores', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket', 'search_status')
+    )
+    op.create_table(
+        'location_search_counts',
+        sa.Column('location', sa.String(length=255), nullable=False),
+        sa.Column('search_count', sa.BigInteger(), nullable=False),
+        sa.Column('last_searched_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('location')
+    )
+    op.create_index('ix_location_search_counts_search_count', 'location_search_counts', ['search_count'])
+
+    # Shared with the EXPLAIN checks, so they test the SQL that actually ran
+    for statement in backfill_statements(op.get_context().dialect.name):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_location_search_counts_search_count', table_name='location_search_counts')
+    op.drop_table('location_search_counts')
+    op.drop_table('search_stats_hourly')
@@ -0,0 +1,32 @@
+"""location_cache.store_count
+
+Lets /analytics/cached-searches list entries without loading the results JSON.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('location_cache', sa.Column('store_count', sa.Integer(), nullable=True))
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute("UPDATE location_cache SET store_count = COALESCE(json_array_length(results->'stores'), 0)")
+    else:
+        op.execute("UPDATE location_cache SET store_count = COALESCE(json_array_length(results, '$.stores'), 0)")
+
+
+def downgrade() -> None:
+    op.drop_column('location_cache', 'store_count')
@@ -0,0 +1,74 @@
+"""stores.geohash
+
+Geohash of each store's coordinates, indexed for the prefix lookups behind
+/stores/nearby. Existing stores are backfilled in batches; the index is built
+with CREATE INDEX CONCURRENTLY on PostgreSQL (varchar_pattern_ops, so LIKE
+'prefix%' can use it under any collation).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from spatial import encode
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 5000
+
+stores = sa.table(
+    'stores',
+    sa.column('id', sa.Integer),
+    sa.column('latitude', sa.DECIMAL(10, 8)),
+    sa.column('longitude', sa.DECIMAL(11, 8)),
+    sa.column('geohash', sa.String(12)),
+)
+
+
+def backfill() -> None:
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(stores.c.id, stores.c.latitude, stores.c.longitude)
+            .where(stores.c.id > last_id, stores.c.latitude.isnot(None), stores.c.longitude.isnot(None))
+            .order_by(stores.c.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return
+        bind.execute(
+            stores.update().where(stores.c.id == sa.bindparam('store_id')).values(geohash=sa.bindparam('hash')),
+            [{'store_id': row.id, 'hash': encode(row.latitude, row.longitude)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.add_column('stores', sa.Column('geohash', sa.String(length=12), nullable=True))
+    # Offline (--sql) mode has no rows to read; stores are hashed as they are next upserted
+    if not op.get_context().as_sql:
+        backfill()
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stores_geohash', 'stores', ['geohash'],
+            postgresql_ops={'geohash': 'varchar_pattern_ops'},
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_stores_geohash', table_name='stores', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('stores', 'geohash')
@@ -0,0 +1,41 @@
+"""nearby_cache
+
+Nearby Search results keyed by geohash cell, radius and place type, shared by
+/search and /bulk_search queries whose centers fall in the same cell.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'nearby_cache',
+        sa.Column('cell', sa.String(length=12), nullable=False),
+        sa.Column('radius', sa.Integer(), nullable=False),
+        sa.Column('place_type', sa.String(length=50), nullable=False),
+        sa.Column('results', sa.JSON(), nullable=True),
+        sa.Column('exhaustive', sa.Boolean(), nullable=False),
+        sa.Column('cached_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('cell', 'radius', 'place_type')
+    )
+    op.create_index('ix_nearby_cache_expires_at', 'nearby_cache', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_nearby_cache_expires_at', table_name='nearby_cache')
+    op.drop_table('nearby_cache')
@@ -0,0 +1,39 @@
+"""place_details_cache
+
+Place Details results keyed by place_id and field mask, shared by every
+endpoint and script that looks up details.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'place_details_cache',
+        sa.Column('place_id', sa.String(length=255), nullable=False),
+        sa.Column('fields', sa.String(length=255), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('cached_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('place_id', 'fields')
+    )
+    op.create_index('ix_place_details_cache_expires_at', 'place_details_cache', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_place_details_cache_expires_at', table_name='place_details_cache')
+    op.drop_table('place_details_cache')
@@ -0,0 +1,35 @@
+"""search_history phase timings
+
+Per-phase durations and the number of Google API calls of each search, as
+reported in /search's Server-Timing header, so slow searches can be broken
+down in SQL. Added as nullable columns, which PostgreSQL adds without
+rewriting the table; rows written before this migration stay NULL.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMING_COLUMNS = ('cache_ms', 'geocode_ms', 'nearby_ms', 'pagetoken_wait_ms', 'details_ms', 'save_ms', 'upstream_calls')
+
+
+def upgrade() -> None:
+    for column in TIMING_COLUMNS:
+        op.add_column('search_history', sa.Column(column, sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    for column in reversed(TIMING_COLUMNS):
+        op.drop_column('search_history', column)
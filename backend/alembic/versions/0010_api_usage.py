@@ -0,0 +1,36 @@
+"""api_usage
+
+Google API calls per day, billing SKU and originating job, written by every
+backend worker and crawl script, and read back to enforce the daily budget.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'api_usage',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('sku', sa.String(length=50), nullable=False),
+        sa.Column('source', sa.String(length=100), nullable=False),
+        sa.Column('calls', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'sku', 'source')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('api_usage')
@@ -0,0 +1,284 @@
+"""
+Metering of Google API calls by SKU, with per-job and per-day budgets.
+
+Both Google clients charge every request before sending it (retries included):
+- to its SKU, from the endpoint name callers pass (SKUS; Places API (New)
+  calls get their own `_new` SKUs);
+- to the Meter of the job that made it: a context variable set by the /search
+  and /bulk_search handlers, background refreshes and crawl scripts
+  (start_crawl). Calls outside any job go to the process meter. A Meter with a
+  budget refuses further calls with BudgetExceeded once it is spent;
+- to the day's (UTC) totals in `ledger`, which refuse calls past API_DAILY_BUDGET.
+
+When a database is attached, the ledger adds its totals to the api_usage table
+(day, sku, source) every API_USAGE_FLUSH_INTERVAL seconds. The daily budget
+then covers every worker and script sharing the database, counting other
+processes' calls as of their last flush.
+
+Settings (environment):
+- API_DAILY_BUDGET: max Google calls per UTC day, all SKUs (default 0: no limit)
+- API_SEARCH_BUDGET: max calls one /search (or its background refresh) may make (default 0: no limit)
+- API_BULK_BUDGET: default and max call budget of one /bulk_search (default 2000; 0: no limit)
+- API_CRAWL_BUDGET: max calls per run of a src/ crawl script (default 0: no limit)
+- API_USAGE_FLUSH_INTERVAL: seconds between writes to the api_usage table (default 5)
+"""
+import atexit
+import os
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+# Only the backend installs prometheus_client
+try:
+    import metrics
+except ImportError:
+    metrics = None
+
+API_DAILY_BUDGET = int(os.getenv('API_DAILY_BUDGET', '0'))
+API_SEARCH_BUDGET = int(os.getenv('API_SEARCH_BUDGET', '0'))
+API_BULK_BUDGET = int(os.getenv('API_BULK_BUDGET', '2000'))
+API_CRAWL_BUDGET = int(os.getenv('API_CRAWL_BUDGET', '0'))
+API_USAGE_FLUSH_INTERVAL = float(os.getenv('API_USAGE_FLUSH_INTERVAL', '5'))
+
+# Billing SKU per endpoint name passed to the Google clients
+SKUS = {
+    'geocode': 'geocoding',
+    'reverse_geocode': 'geocoding',
+    'nearby': 'nearby_search',
+    'details': 'place_details',
+    'text_search': 'text_search',
+}
+PLACES_NEW_HOST = '//places.googleapis.com/'
+
+class BudgetExceeded(Exception):
+    """A Google call was refused because a budget is spent; `scope` is 'job' or 'daily'."""
+
+    def __init__(self, message, scope):
+        super().__init__(message)
+        self.scope = scope
+
+def sku_for(endpoint, url=''):
+    sku = SKUS.get(endpoint, endpoint)
+    # Places API (New) is billed separately from the legacy web services
+    if PLACES_NEW_HOST in url:
+        sku += '_new'
+    return sku
+
+def job_budget(requested, limit):
+    """Budget for a job that asked for `requested` calls (None: the default) under a configured `limit` (0: none)."""
+    if limit and requested:
+        return min(requested, limit)
+    return requested or limit
+
+class Meter:
+    """Google calls made by one search, bulk job or crawl; refuses calls past `budget` (0: no limit)."""
+
+    def __init__(self, source, budget=0):
+        self.source = source
+        self.budget = budget
+        self.calls = 0
+        self.by_sku = {}
+
+    def check(self):
+        if self.budget and self.calls >= self.budget:
+            raise BudgetExceeded(f"Google API call budget of {self.budget} for this {self.source} job is spent", 'job')
+
+    def add(self, sku):
+        self.calls += 1
+        self.by_sku[sku] = self.by_sku.get(sku, 0) + 1
+
+    def summary(self):
+        return {'source': self.source, 'calls': self.calls, 'budget': self.budget or None, 'by_sku': dict(self.by_sku)}
+
+current = ContextVar('api_meter', default=None)
+process_meter = Meter('backend')
+
+class UsageLedger:
+    """
+    This process's call counts per (day, sku, source), enforcing the daily
+    budget. start() attaches a session factory and a daemon thread that adds
+    the counts to api_usage and reads back the day's total for all processes.
+    """
+
+    def __init__(self, daily_budget=API_DAILY_BUDGET, flush_interval=API_USAGE_FLUSH_INTERVAL):
+        self.daily_budget = daily_budget
+        self.flush_interval = flush_interval
+        self.session_factory = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._totals = {}
+        self._day = None
+        # Day total as of the last flush (all processes), and this process's calls since
+        self._synced = 0
+        self._unsynced = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _check(self):
+        # Caller holds the lock
+        day = datetime.utcnow().date()
+        if day != self._day:
+            self._day, self._synced, self._unsynced = day, 0, 0
+        if self.daily_budget and self._synced + self._unsynced >= self.daily_budget:
+            raise BudgetExceeded(f"Daily Google API budget of {self.daily_budget} calls is spent", 'daily')
+        return day
+
+    def check(self):
+        """Raise BudgetExceeded if the day's budget is spent, without charging a call."""
+        with self._lock:
+            self._check()
+
+    def charge(self, sku, source):
+        with self._lock:
+            day = self._check()
+            self._unsynced += 1
+            key = (day, sku, source)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._totals[key] = self._totals.get(key, 0) + 1
+
+    def stats(self):
+        """Calls by this process since it started, per day, SKU and source, and today's total as far as it knows."""
+        with self._lock:
+            totals = [{'day': day.isoformat(), 'sku': sku, 'source': source, 'calls': calls}
+                      for (day, sku, source), calls in sorted(self._totals.items())]
+            today = self._synced + self._unsynced if self._day == datetime.utcnow().date() else 0
+        return {'calls': totals, 'today_total': today, 'daily_budget': self.daily_budget or None}
+
+    def start(self, session_factory):
+        self.session_factory = session_factory
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='api-usage-ledger', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=30):
+        """Write the remaining counts and stop the thread. Blocking."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            day, unsynced = self._day, self._unsynced
+        if self.session_factory is None or (not pending and not self.daily_budget):
+            return
+        db = self.session_factory()
+        try:
+            write_usage(db, pending)
+            total = day_total(db, day) if day is not None else 0
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Writing API usage failed: {e}")
+            # Keep the counts for the next flush
+            with self._lock:
+                for key, calls in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + calls
+            return
+        finally:
+            db.close()
+        with self._lock:
+            # Calls charged during the flush stay unsynced
+            if self._day == day:
+                self._synced = total
+                self._unsynced -= unsynced
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+ledger = UsageLedger()
+
+def check():
+    """Raise BudgetExceeded if the current job's or the day's budget is spent, without charging a call."""
+    meter = current.get() or process_meter
+    try:
+        meter.check()
+        ledger.check()
+    except BudgetExceeded as e:
+        if metrics is not None:
+            metrics.API_BUDGET_REJECTIONS.labels(meter.source, e.scope).inc()
+        raise
+
+def charge(endpoint, url=''):
+    """Count one Google request against the current job and the day; raises BudgetExceeded instead when either is spent."""
+    meter = current.get() or process_meter
+    sku = sku_for(endpoint, url)
+    try:
+        meter.check()
+        ledger.charge(sku, meter.source)
+    except BudgetExceeded as e:
+        if metrics is not None:
+            metrics.API_BUDGET_REJECTIONS.labels(meter.source, e.scope).inc()
+        raise
+    meter.add(sku)
+    if metrics is not None:
+        metrics.API_CALLS.labels(sku, meter.source).inc()
+
+# The database modules are imported where used: crawl scripts load this module
+# through google_client without the backend's database dependencies
+
+def write_usage(db, counts):
+    """Add {(day, sku, source): calls} to api_usage. Does not commit."""
+    if not counts:
+        return
+    from models import ApiUsage
+    from upserts import dialect_insert
+    insert = dialect_insert(db, ApiUsage)
+    stmt = insert.on_conflict_do_update(
+        index_elements=['day', 'sku', 'source'],
+        set_={'calls': ApiUsage.calls + insert.excluded.calls}
+    )
+    db.execute(stmt, [{'day': day, 'sku': sku, 'source': source, 'calls': calls}
+                      for (day, sku, source), calls in sorted(counts.items())])
+
+def day_total(db, day):
+    """Calls recorded in api_usage for one day, all SKUs and sources."""
+    from sqlalchemy import func
+    from models import ApiUsage
+    return db.query(func.coalesce(func.sum(ApiUsage.calls), 0)).filter(ApiUsage.day == day).scalar()
+
+def usage_by_day(db, days):
+    """api_usage for the last `days` days, newest first, as [{day, total, by_sku, by_source}]."""
+    from models import ApiUsage
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.query(ApiUsage.day, ApiUsage.sku, ApiUsage.source, ApiUsage.calls).filter(
+        ApiUsage.day >= since
+    ).order_by(ApiUsage.day.desc()).all()
+    by_day = {}
+    for day, sku, source, calls in rows:
+        entry = by_day.setdefault(day, {'day': day.isoformat(), 'total': 0, 'by_sku': {}, 'by_source': {}})
+        entry['total'] += calls
+        entry['by_sku'][sku] = entry['by_sku'].get(sku, 0) + calls
+        entry['by_source'][source] = entry['by_source'].get(source, 0) + calls
+    return list(by_day.values())
+
+def start_crawl(source=None):
+    """
+    For src/ scripts: charge this process's calls to `source` (default
+    crawl:<script name>) under API_CRAWL_BUDGET, and with DATABASE_URL set,
+    add them to the api_usage table. A summary is printed at exit.
+    """
+    global process_meter
+    if source is None:
+        source = 'crawl:' + os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+    process_meter = Meter(source, API_CRAWL_BUDGET)
+    if os.getenv('DATABASE_URL'):
+        try:
+            from database import SessionLocal
+        except ImportError as e:
+            print(f"API usage is only counted in this process: {e}")
+        else:
+            ledger.start(SessionLocal)
+    atexit.register(_finish_crawl)
+
+def _finish_crawl():
+    ledger.stop()
+    summary = process_meter.summary()
+    if summary['calls']:
+        by_sku = ', '.join(f'{sku}: {calls}' for sku, calls in sorted(summary['by_sku'].items()))
+        print(f"Google API calls by {summary['source']}: {summary['calls']} ({by_sku})")
@@ -0,0 +1,91 @@
+"""
+Concurrent /search throughput: blocking handler (before) vs async handler (after).
+
+The backend and the fake Google API (benchmarks/fake_google_api.py) each run as
+a single uvicorn worker process. "before" is a copy of the previous blocking
+request path (benchmarks/legacy_app.py: requests + time.sleep in a sync def, so
+each in-flight search holds a threadpool worker); "after" is the real /search
+endpoint. Every request uses a unique location so all of them miss the cache.
+
+Usage (from backend/):
+    python benchmarks/bench_async_search.py --requests 200 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_google_api import start_uvicorn
+
+FAKE_PORT = 8765
+APP_PORT = 8766
+
+async def run_load(path, total, concurrency):
+    import httpx
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{APP_PORT}', timeout=600,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.get(path, params={'location': f'bench-{uuid.uuid4().hex}'})
+                latencies.append(time.perf_counter() - start)
+                if resp.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'elapsed': elapsed,
+        'throughput': total / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Total searches per variant')
+    parser.add_argument('--concurrency', type=int, default=200, help='Concurrent in-flight searches')
+    parser.add_argument('--latency-ms', type=float, default=100, help='Fake upstream latency per call')
+    parser.add_argument('--pages', type=int, default=2, help='Nearby Search pages per search (2 s wait between pages)')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['FAKE_GOOGLE_LATENCY_MS'] = str(args.latency_ms)
+    env['FAKE_GOOGLE_PAGES'] = str(args.pages)
+    env['FAKE_GOOGLE_RESULTS_PER_PAGE'] = '5'
+    env['GOOGLE_MAPS_BASE_URL'] = f'http://127.0.0.1:{FAKE_PORT}'
+    env.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/bench.db')
+
+    procs = [
+        start_uvicorn('benchmarks.fake_google_api:app', FAKE_PORT, env),
+        start_uvicorn('benchmarks.legacy_app:app', APP_PORT, env),
+    ]
+    try:
+        print(f"{args.requests} searches, {args.concurrency} concurrent, {args.pages} page(s), "
+              f"{args.latency_ms:.0f} ms upstream latency, DB {env['DATABASE_URL']}")
+        for label, path in (('before (blocking)', '/bench/legacy_search'), ('after (async)', '/search')):
+            stats = asyncio.run(run_load(path, args.requests, args.concurrency))
+            print(f"{label:<18} {stats['throughput']:7.1f} req/s  elapsed {stats['elapsed']:6.2f}s  "
+                  f"p50 {stats['p50']:6.2f}s  p95 {stats['p95']:6.2f}s  errors {stats['errors']}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Nearby Search calls and recall of /bulk_search grid mode vs adaptive mode.
+
+Runs the backend against benchmarks/fake_google_api.py in "field" mode (a fixed
+set of fake stores with a 20-per-page / 60-result cap) for a sparse and a dense
+scenario, and reports how many Nearby Search calls each mode made and what
+fraction of the stores inside the search circle it found.
+
+Usage (from backend/):
+    python benchmarks/bench_bulk_modes.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_google_api import start_uvicorn
+
+FAKE_PORT = 8765
+APP_PORT = 8766
+CENTER = (35.681236, 139.767125)
+
+# (label, stores in the field, gaussian spread in m, search radius in m)
+SCENARIOS = [
+    ('sparse', 40, 6000, 20000),
+    ('dense', 3000, 2500, 8000),
+]
+
+def field_truth(env, radius):
+    """place_ids of field stores inside the search circle, using the fake API's own field."""
+    os.environ.update(env)
+    import importlib
+    from benchmarks import fake_google_api
+    importlib.reload(fake_google_api)
+    return {
+        place_id for place_id, lat, lng in fake_google_api.FIELD
+        if fake_google_api._distance_m(CENTER[0], CENTER[1], lat, lng) <= radius
+    }
+
+def run_bulk(mode, radius):
+    import httpx
+    params = {'center': f'{CENTER[0]},{CENTER[1]}', 'radius': radius, 'spacing': 2000, 'mode': mode, 'concurrency': 20}
+    calls, found = 0, set()
+    with httpx.stream('GET', f'http://127.0.0.1:{APP_PORT}/bulk_search', params=params, timeout=600) as resp:
+        for line in resp.iter_lines():
+            if not line.startswith('data: '):
+                continue
+            event = json.loads(line[len('data: '):])
+            calls += 1
+            found.update(store['place_id'] for store in event['stores'])
+    return calls, found
+
+def main():
+    base_env = dict(os.environ)
+    base_env.update({
+        'FAKE_GOOGLE_LATENCY_MS': '5',
+        'GOOGLE_MAPS_BASE_URL': f'http://127.0.0.1:{FAKE_PORT}',
+        'BULK_RATE_PER_SECOND': '1000',
+        'BULK_RATE_BURST': '1000',
+        'ADAPTIVE_MAX_CELLS': '5000',
+        'FAKE_GOOGLE_FIELD_CENTER': f'{CENTER[0]},{CENTER[1]}',
+    })
+    base_env.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/bench.db')
+
+    for label, stores, spread, radius in SCENARIOS:
+        env = dict(base_env, FAKE_GOOGLE_FIELD_STORES=str(stores), FAKE_GOOGLE_FIELD_SPREAD_M=str(spread))
+        truth = field_truth(env, radius)
+        procs = [
+            start_uvicorn('benchmarks.fake_google_api:app', FAKE_PORT, env),
+            start_uvicorn('main:app', APP_PORT, env),
+        ]
+        try:
+            print(f"{label}: {stores} stores (spread {spread} m), radius {radius} m, {len(truth)} stores inside")
+            for mode in ('grid', 'adaptive'):
+                calls, found = run_bulk(mode, radius)
+                recall = len(found & truth) / len(truth) if truth else 1.0
+                print(f"  {mode:<9} {calls:5d} Nearby Search calls  recall {recall:6.1%}")
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Per-request latency of bare one-shot requests vs the pooled google_client, over TLS.
+
+Starts benchmarks/fake_google_api.py behind a throwaway self-signed certificate
+(generated with the `openssl` CLI) and issues sequential Place Details calls:
+
+- sync:  requests.get per call (new TCP + TLS handshake each time, as the
+         src/ scripts used to do) vs google_client.GoogleClient
+- async: a new aiohttp session per call vs google_client.AsyncGoogleClient
+
+Usage (from backend/):
+    python benchmarks/bench_connection_reuse.py --requests 300
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_google_api import start_uvicorn
+
+PORT = 8767
+URL = f'https://127.0.0.1:{PORT}/maps/api/place/details/json'
+
+def make_certificate(directory):
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-keyout', key, '-out', cert, '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    mean = statistics.mean(latencies) * 1000
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{label:<34} mean {mean:7.2f} ms  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+    return mean
+
+def timed(fn, n):
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def timed_async(fn, n):
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        await fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_sync(n, cert):
+    import requests
+    from google_client import GoogleClient
+
+    def bare(i):
+        requests.get(URL, params={'place_id': f'p{i}'}, verify=cert).raise_for_status()
+
+    client = GoogleClient(verify=cert)
+
+    def pooled(i):
+        client.get('details', URL, params={'place_id': f'p{i}'}).raise_for_status()
+
+    before = summarize('sync  requests.get (no reuse)', timed(bare, n))
+    after = summarize('sync  GoogleClient (pooled)', timed(pooled, n))
+    client.close()
+    return before, after
+
+async def run_async(n, cert):
+    import aiohttp
+    from google_client import AsyncGoogleClient
+
+    ssl_context = ssl.create_default_context(cafile=cert)
+
+    async def bare(i):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(URL, params={'place_id': f'p{i}'}, ssl=ssl_context) as resp:
+                resp.raise_for_status()
+                await resp.json()
+
+    client = AsyncGoogleClient()
+    await client.start()
+
+    async def pooled(i):
+        await client.get_json('details', URL, {'place_id': f'p{i}'}, ssl=ssl_context)
+
+    before = summarize('async new session per call', await timed_async(bare, n))
+    after = summarize('async AsyncGoogleClient (pooled)', await timed_async(pooled, n))
+    await client.close()
+    return before, after
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300, help='Sequential calls per variant')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    cert, key = make_certificate(workdir)
+    env = dict(os.environ, FAKE_GOOGLE_LATENCY_MS='0')
+    proc = start_uvicorn('benchmarks.fake_google_api:app', PORT, env, '--ssl-keyfile', key, '--ssl-certfile', cert)
+    try:
+        print(f"{args.requests} sequential Place Details calls per variant against https://127.0.0.1:{PORT}")
+        for before, after in (run_sync(args.requests, cert), asyncio.run(run_async(args.requests, cert))):
+            print(f"  saved per request: {before - after:.2f} ms ({(1 - after / before) * 100:.0f}%)")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == '__main__':
+    main()
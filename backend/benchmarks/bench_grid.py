@@ -0,0 +1,61 @@
+"""
+Microbenchmark: the previous pure-Python grid generator vs grid.generate_grid_points.
+
+Usage (from backend/):
+    python benchmarks/bench_grid.py
+"""
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grid import generate_grid_points
+
+CENTER = (35.681236, 139.767125)
+# (radius m, spacing m)
+CASES = [(5000, 2000), (20000, 2000), (20000, 500), (50000, 250)]
+
+def legacy_generate_grid_points(center, radius, spacing):
+    """Verbatim copy of the generator /bulk_search used before grid.py was vectorized."""
+    points = []
+    R = 6371000
+    clat, clng = center
+    dLat = spacing / R * (180 / math.pi)
+    dLng = spacing / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi)
+    for lat in frange(clat - radius / R * (180 / math.pi), clat + radius / R * (180 / math.pi), dLat):
+        for lng in frange(clng - radius / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi), clng + radius / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi), dLng):
+            d = R * math.acos(
+                math.sin(clat * math.pi / 180) * math.sin(lat * math.pi / 180) +
+                math.cos(clat * math.pi / 180) * math.cos(lat * math.pi / 180) * math.cos((lng - clng) * math.pi / 180)
+            )
+            if d <= radius:
+                points.append((lat, lng))
+    return points
+
+def frange(start, stop, step):
+    while start <= stop:
+        yield start
+        start += step
+
+def best_of(fn, repeat=5):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def main():
+    print(f"{'radius':>7} {'spacing':>7} {'points':>8} {'hex':>8} {'legacy':>10} {'numpy':>10} {'speedup':>8}")
+    for radius, spacing in CASES:
+        legacy_points = legacy_generate_grid_points(CENTER, radius, spacing)
+        points = generate_grid_points(CENTER, radius, spacing)
+        hex_points = generate_grid_points(CENTER, radius, spacing, packing='hex')
+        legacy_time = best_of(lambda: legacy_generate_grid_points(CENTER, radius, spacing), repeat=3)
+        numpy_time = best_of(lambda: generate_grid_points(CENTER, radius, spacing))
+        print(f"{radius:>7} {spacing:>7} {len(points):>8} {len(hex_points):>8} "
+              f"{legacy_time * 1000:>8.2f}ms {numpy_time * 1000:>8.2f}ms {legacy_time / numpy_time:>7.1f}x")
+        if len(points) != len(legacy_points):
+            print(f"        note: legacy generator returned {len(legacy_points)} points")
+
+if __name__ == '__main__':
+    main()
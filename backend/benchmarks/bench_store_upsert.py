@@ -0,0 +1,96 @@
+"""
+Store write path: one db.add() per store (the previous /search code) vs
+upserts.upsert_stores().
+
+Simulates a run of searches that each return `--per-search` stores, drawn from
+a pool so that searches overlap by `--overlap` (the per-row path can only write
+stores it hasn't seen before, so it is given just the new ones and skips the
+rest - which is what made repeated searches fail before).
+
+Usage (from backend/):
+    python benchmarks/bench_store_upsert.py --stores 5000
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_store_upsert.py
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/bench.db')
+
+from database import SessionLocal, engine
+from models import Base, SearchHistory, Store as StoreModel
+from upserts import upsert_stores
+
+def make_store(i):
+    return {
+        'name': f'Hardware {i}',
+        'address': f'{i} Example Street, Tokyo',
+        'website': f'https://example.com/{i}',
+        'phone': '(555) 010-0000',
+        'place_id': f'place-{i:08d}',
+        'latitude': 35.6 + (i % 1000) / 10000,
+        'longitude': 139.7 + (i // 1000) / 10000,
+    }
+
+def make_searches(total, per_search, overlap, seed=1):
+    """Batches of stores; each batch repeats `overlap` of its stores from earlier batches."""
+    rng = random.Random(seed)
+    searches, seen, next_id = [], [], 0
+    while next_id < total:
+        repeats = rng.sample(seen, min(len(seen), int(per_search * overlap)))
+        fresh = list(range(next_id, min(total, next_id + per_search - len(repeats))))
+        next_id += len(fresh)
+        seen.extend(fresh)
+        searches.append([make_store(i) for i in repeats + fresh])
+    return searches
+
+def reset_schema():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+def run(label, searches, write):
+    reset_schema()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for stores in searches:
+            search = SearchHistory(location='bench', search_status='success')
+            db.add(search)
+            db.flush()
+            write(db, search.id, stores)
+            db.commit()
+        elapsed = time.perf_counter() - start
+        rows = sum(len(stores) for stores in searches)
+        count = db.query(StoreModel).count()
+    finally:
+        db.close()
+    print(f"{label:<10} {elapsed * 1000:9.1f} ms  {rows / elapsed:9.0f} stores/s  {count} rows in stores")
+
+def write_per_row(db, search_id, stores):
+    known = {place_id for (place_id,) in db.query(StoreModel.place_id).filter(
+        StoreModel.place_id.in_([store['place_id'] for store in stores]))}
+    for store in stores:
+        if store['place_id'] not in known:
+            db.add(StoreModel(search_id=search_id, **store))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', type=int, default=5000, help='distinct stores to write')
+    parser.add_argument('--per-search', type=int, default=60)
+    parser.add_argument('--overlap', type=float, default=0.3, help='fraction of each search already seen')
+    args = parser.parse_args()
+
+    searches = make_searches(args.stores, args.per_search, args.overlap)
+    print(f"{len(searches)} searches x {args.per_search} stores, {args.overlap:.0%} overlap, "
+          f"DB {engine.url.render_as_string(hide_password=True)}")
+    run('per-row', searches, write_per_row)
+    run('upsert', searches, upsert_stores)
+    # Everything at once, e.g. a large bulk import
+    run('one batch', [[store for stores in searches for store in stores]], upsert_stores)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Checks that the analytics queries are planned on their indexes, on a
+database filled to production-like size: the rollup tables behind
+/analytics/popular-searches and /analytics/search-stats (migration 0004), the
+search_history and location_cache indexes of migration 0003.
+
+Migrates the database at DATABASE_URL, loads synthetic search_history and
+location_cache rows until --rows is reached (generate_series on PostgreSQL, a
+recursive CTE on SQLite), rebuilds the rollup tables with migration 0004's backfill, then prints the
+EXPLAIN plan of each query and fails if an expected index is not used. Use a
+scratch database: rows are added to it. tests/test_query_plans.py runs the
+same checks on a small SQLite database.
+
+Usage (from backend/):
+    DATABASE_URL=postgresql://localhost/explain_check python benchmarks/explain_analytics.py --rows 10000000
+    python benchmarks/explain_analytics.py --rows 1000000   # SQLite in a temp dir
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/explain.db')
+
+from sqlalchemy import func, select, text
+
+import main
+import rollups
+from database import engine, run_migrations
+from models import SearchHistory
+
+LOCATIONS = 50000
+CACHE_ROWS_PER_SEARCH = 20
+
+# The queries the /analytics endpoints run, built by the same functions, with
+# the index each one should use; primary key index names differ by dialect
+CHECKS = [
+    ('popular-searches', rollups.popular_locations_query(),
+        ('ix_location_search_counts_search_count',)),
+    ('search-stats (as_of)', rollups.search_stats_query(as_of=datetime(2025, 12, 31, 23, 30)),
+        ('search_stats_hourly_pkey', 'sqlite_autoindex_search_stats_hourly_1')),
+    ('recent-searches', main.recent_searches_query(),
+        ('ix_search_history_search_timestamp',)),
+    ('cached-searches (next page)', main.cached_searches_query(True, f"{datetime(2026, 1, 1).isoformat()}|{'f' * 64}")
+        .limit(main.CACHED_SEARCHES_PAGE_SIZE + 1),
+        ('ix_location_cache_cached_at',)),
+]
+
+POSTGRES_LOAD = [
+    """
+    INSERT INTO search_history (location, search_timestamp, user_ip, search_status, store_count, response_time_ms)
+    SELECT 'Location ' || (random() * :locations)::int,
+           now() - random() * interval '365 days',
+           '10.0.' || (i % 256) || '.' || (i / 256 % 256),
+           CASE WHEN random() < 0.85 THEN 'success' WHEN random() < 0.5 THEN 'no_results' ELSE 'error' END,
+           (random() * 60)::int,
+           (random() * 3000)::int
+    FROM generate_series(1, :count) AS i
+    """,
+    """
+    INSERT INTO location_cache (location_hash, location, results, cached_at, expires_at)
+    SELECT md5(i::text || clock_timestamp()::text), 'Location ' || i, '{"stores": []}',
+           now() - random() * interval '60 days',
+           now() + (random() * 60 - 30) * interval '1 day'
+    FROM generate_series(1, :cache_count) AS i
+    """,
+]
+
+SQLITE_LOAD = [
+    """
+    WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < :count)
+    INSERT INTO search_history (location, search_timestamp, user_ip, search_status, store_count, response_time_ms)
+    SELECT 'Location ' || (abs(random()) % :locations),
+           datetime('now', '-' || (abs(random()) % 31536000) || ' seconds'),
+           '10.0.' || (i % 256) || '.' || (i / 256 % 256),
+           CASE WHEN abs(random()) % 100 < 85 THEN 'success' WHEN abs(random()) % 2 = 0 THEN 'no_results' ELSE 'error' END,
+           abs(random()) % 60,
+           abs(random()) % 3000
+    FROM seq
+    """,
+    """
+    WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < :cache_count)
+    INSERT INTO location_cache (location_hash, location, results, cached_at, expires_at)
+    SELECT hex(randomblob(16)), 'Location ' || i, '{"stores": []}',
+           datetime('now', '-' || (abs(random()) % 5184000) || ' seconds'),
+           datetime('now', (abs(random()) % 5184000 - 2592000) || ' seconds')
+    FROM seq
+    """,
+]
+
+def rollup_load():
+    """Rebuild the rollup tables from search_history with migration 0004's backfill."""
+    return ["DELETE FROM search_stats_hourly", "DELETE FROM location_search_counts"] + \
+        rollups.backfill_statements(engine.dialect.name)
+
+def load(rows):
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(SearchHistory)).scalar()
+    missing = rows - existing
+    if missing <= 0:
+        print(f"search_history already has {existing} rows")
+        return
+    print(f"Loading {missing} search_history rows ...", flush=True)
+    start = time.perf_counter()
+    statements = POSTGRES_LOAD if engine.dialect.name == 'postgresql' else SQLITE_LOAD
+    params = {'count': missing, 'locations': LOCATIONS, 'cache_count': max(1, missing // CACHE_ROWS_PER_SEARCH)}
+    with engine.begin() as conn:
+        for statement in statements + rollup_load():
+            conn.execute(text(statement), params)
+    # Fresh statistics (and, on PostgreSQL, a visibility map for index-only scans)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM ANALYZE' if engine.dialect.name == 'postgresql' else 'ANALYZE'))
+    print(f"Loaded in {time.perf_counter() - start:.1f}s")
+
+def explain(stmt):
+    compiled = stmt.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = 'EXPLAIN' if engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN'
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'{prefix} {compiled}', params).fetchall()
+    # PostgreSQL returns one text line per row, SQLite (id, parent, notused, detail)
+    return '\n'.join(str(row[-1]) for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000, help='search_history rows to check against')
+    args = parser.parse_args()
+
+    print(f"DB {engine.url.render_as_string(hide_password=True)}")
+    run_migrations()
+    load(args.rows)
+
+    failures = 0
+    for label, stmt, indexes in CHECKS:
+        plan = explain(stmt)
+        ok = any(index in plan for index in indexes)
+        failures += not ok
+        print(f"\n[{'ok' if ok else 'FAIL'}] {label}: expects {' or '.join(indexes)}")
+        print('    ' + plan.replace('\n', '\n    '))
+    print(f"\n{len(CHECKS) - failures}/{len(CHECKS)} queries use their index")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Local stand-in for the Google Geocoding / Places endpoints used by the backend.
+
+Responses are deterministic fakes derived from the request parameters, and every
+endpoint waits FAKE_GOOGLE_LATENCY_MS before answering so benchmarks see a
+realistic upstream round-trip without spending quota.
+
+By default Nearby Search returns FAKE_GOOGLE_PAGES full pages for any location.
+With FAKE_GOOGLE_FIELD_STORES=N it instead serves a fixed field of N stores
+scattered around FAKE_GOOGLE_FIELD_CENTER (gaussian, FAKE_GOOGLE_FIELD_SPREAD_M),
+returning only those inside the requested radius, nearest first, 20 per page and
+at most 60 - like the real API's result cap.
+
+Like Google's, a next_page_token is only accepted FAKE_GOOGLE_PAGETOKEN_DELAY_MS
+after it was issued; earlier requests get INVALID_REQUEST (default 0).
+
+Run standalone:
+    uvicorn benchmarks.fake_google_api:app --port 8765
+"""
+import asyncio
+import hashlib
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from fastapi import FastAPI, Request
+
+LATENCY_MS = float(os.getenv('FAKE_GOOGLE_LATENCY_MS', '100'))
+RESULTS_PER_PAGE = int(os.getenv('FAKE_GOOGLE_RESULTS_PER_PAGE', '20'))
+PAGES = int(os.getenv('FAKE_GOOGLE_PAGES', '2'))
+PAGETOKEN_DELAY_MS = float(os.getenv('FAKE_GOOGLE_PAGETOKEN_DELAY_MS', '0'))
+FIELD_STORES = int(os.getenv('FAKE_GOOGLE_FIELD_STORES', '0'))
+FIELD_CENTER = tuple(map(float, os.getenv('FAKE_GOOGLE_FIELD_CENTER', '35.681236,139.767125').split(',')))
+FIELD_SPREAD_M = float(os.getenv('FAKE_GOOGLE_FIELD_SPREAD_M', '3000'))
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+app = FastAPI(title="Fake Google Maps API")
+
+def _make_field():
+    rng = random.Random(42)
+    stores = []
+    for n in range(FIELD_STORES):
+        dlat = rng.gauss(0, FIELD_SPREAD_M) / 111320
+        dlng = rng.gauss(0, FIELD_SPREAD_M) / (111320 * math.cos(math.radians(FIELD_CENTER[0])))
+        stores.append((f'field-{n}', FIELD_CENTER[0] + dlat, FIELD_CENTER[1] + dlng))
+    return stores
+
+FIELD = _make_field()
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+def _field_page(lat, lng, radius, page):
+    inside = sorted(
+        (d, place_id, slat, slng)
+        for place_id, slat, slng in FIELD
+        if (d := _distance_m(lat, lng, slat, slng)) <= radius
+    )[:60]
+    results = [{
+        'name': f'Field Hardware {place_id}',
+        'vicinity': f'{place_id} Field Street',
+        'place_id': place_id,
+        'geometry': {'location': {'lat': slat, 'lng': slng}},
+    } for _, place_id, slat, slng in inside[page * 20:(page + 1) * 20]]
+    return results, len(inside) > (page + 1) * 20
+
+def _coords_for(text):
+    digest = hashlib.md5(text.encode()).digest()
+    lat = (digest[0] / 255) * 120 - 60
+    lng = (digest[1] / 255) * 340 - 170
+    return round(lat, 6), round(lng, 6)
+
+@app.get("/maps/api/geocode/json")
+async def geocode(request: Request):
+    await asyncio.sleep(LATENCY_MS / 1000)
+    params = request.query_params
+    if 'latlng' in params:
+        return {
+            'status': 'OK',
+            'results': [{
+                'formatted_address': f"Fake City near {params['latlng']}",
+                'address_components': [{'long_name': 'Fake City', 'types': ['locality', 'political']}],
+            }],
+        }
+    lat, lng = _coords_for(params.get('address', ''))
+    return {
+        'status': 'OK',
+        'results': [{
+            'formatted_address': params.get('address', ''),
+            'geometry': {'location': {'lat': lat, 'lng': lng}},
+        }],
+    }
+
+@app.get("/maps/api/place/nearbysearch/json")
+async def nearby_search(request: Request):
+    await asyncio.sleep(LATENCY_MS / 1000)
+    params = request.query_params
+    if 'pagetoken' in params:
+        page, location, radius, issued = params['pagetoken'].split('|')
+        page = int(page)
+        if (time.time() - float(issued)) * 1000 < PAGETOKEN_DELAY_MS:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+    else:
+        page, location, radius = 0, params.get('location', '0,0'), params.get('radius', '10000')
+    lat, lng = map(float, location.split(','))
+    if FIELD:
+        results, more = _field_page(lat, lng, float(radius), page)
+        data = {'status': 'OK' if results else 'ZERO_RESULTS', 'results': results}
+        if more:
+            data['next_page_token'] = f'{page + 1}|{location}|{radius}|{time.time()}'
+        return data
+    results = []
+    for i in range(RESULTS_PER_PAGE):
+        n = page * RESULTS_PER_PAGE + i
+        results.append({
+            'name': f'Fake Hardware {n}',
+            'vicinity': f'{n} Fake Street',
+            'place_id': f'fake-{location}-{n}',
+            'geometry': {'location': {'lat': lat + n * 1e-4, 'lng': lng + n * 1e-4}},
+        })
+    data = {'status': 'OK', 'results': results}
+    if page + 1 < PAGES:
+        data['next_page_token'] = f'{page + 1}|{location}|{radius}|{time.time()}'
+    return data
+
+@app.get("/maps/api/place/details/json")
+async def place_details(request: Request):
+    await asyncio.sleep(LATENCY_MS / 1000)
+    place_id = request.query_params.get('place_id', '')
+    return {
+        'status': 'OK',
+        'result': {
+            'name': place_id,
+            'formatted_address': f'{place_id} Fake Street, Fake City',
+            'formatted_phone_number': '(555) 010-0000',
+            'website': f'https://example.com/{place_id}',
+        },
+    }
+
+def start_uvicorn(target, port, env, *extra_args):
+    """Launch `uvicorn target` as a child process and wait until the port accepts connections."""
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', target, '--port', str(port), '--log-level', 'warning', *extra_args],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f'{target} did not start on port {port}')
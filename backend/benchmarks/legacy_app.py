@@ -0,0 +1,58 @@
+"""
+The backend app plus a copy of the pre-async blocking /search request path,
+mounted at /bench/legacy_search, so benchmarks can compare both in one worker:
+
+    uvicorn benchmarks.legacy_app:app --port 8766
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from fastapi import Depends, Query, Request
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from database import get_db
+from google_client import endpoint_timeout
+from models import SearchHistory
+
+app = main.app
+executor = ThreadPoolExecutor(max_workers=main.DETAILS_CONCURRENCY)
+
+def get_details(place_id):
+    params = {'place_id': place_id, 'fields': main.DETAILS_FIELDS, 'key': main.API_KEY}
+    try:
+        resp = requests.get(main.DETAILS_URL, params=params, timeout=endpoint_timeout('details'))
+        resp.raise_for_status()
+    except requests.RequestException:
+        return {}
+    return resp.json().get('result', {})
+
+@app.get("/bench/legacy_search", include_in_schema=False)
+def legacy_search(location: str = Query(...), request: Request = None, db: Session = Depends(get_db)):
+    record = SearchHistory(location=location, search_status='processing')
+    db.add(record)
+    db.commit()
+    geo = requests.get(main.GEOCODE_URL, params={'address': location, 'key': main.API_KEY}, timeout=10).json()
+    loc = geo['results'][0]['geometry']['location']
+    params = {'location': f"{loc['lat']},{loc['lng']}", 'radius': 10000, 'type': 'hardware_store', 'key': main.API_KEY}
+    results = []
+    next_page_token = None
+    while True:
+        if next_page_token:
+            params['pagetoken'] = next_page_token
+            time.sleep(2)
+        data = requests.get(main.PLACES_URL, params=params, timeout=10).json()
+        results.extend(data.get('results', []))
+        next_page_token = data.get('next_page_token')
+        if not next_page_token:
+            break
+    details = list(executor.map(get_details, [r['place_id'] for r in results]))
+    record.search_status = 'success'
+    record.store_count = len(details)
+    db.commit()
+    return {'location': location, 'stores': len(details)}
@@ -0,0 +1,94 @@
+"""
+In-process LRU cache with per-entry expiry, used in front of the location_cache
+table so hot searches are answered without a database round-trip, and
+single-flight coalescing of identical concurrent cache misses.
+
+Each worker process has its own copy; entries live at most `ttl` seconds so a
+refresh written by another worker is picked up within that window.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded to `maxsize` entries. An entry expires at
+    the earlier of `ttl` seconds after it was set and its own `expires_at`
+    (a naive UTC datetime, as stored in the database). Lookups are counted in
+    the cache_lookups_total metric under `name`, when one is given.
+    """
+
+    def __init__(self, maxsize, ttl, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count('miss')
+                return None
+            value, deadline = entry
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                self._count('expired')
+                return None
+            self._entries.move_to_end(key)
+            self._count('hit')
+            return value
+
+    def _count(self, result):
+        if self.name is not None:
+            metrics.count_cache(self.name, result)
+
+    def set(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        deadline = time.monotonic() + self.ttl
+        if expires_at is not None:
+            # Translate the wall-clock expiry into the monotonic clock used here
+            deadline = min(deadline, time.monotonic() + (expires_at - datetime.utcnow()).total_seconds())
+        with self._lock:
+            self._entries[key] = (value, deadline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time in this event loop: callers that
+    arrive while a call for their key is in flight await its result (or its
+    exception) instead of starting another. The call runs as a task shielded
+    from caller cancellation, so a disconnecting client doesn't abort it for
+    the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def start(self, key, fn):
+        """The task in flight for `key`, or a new one running fn(); and whether it was started here."""
+        task = self._calls.get(key)
+        if task is not None:
+            return task, False
+        task = asyncio.create_task(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return task, True
+
+    async def do(self, key, fn):
+        task, _ = self.start(key, fn)
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
 import os
+import threading
+import time
+
+import metrics
 
 # Get database URL from Railway environment variable
 DATABASE_URL = os.getenv('DATABASE_URL')
@@ -14,8 +20,112 @@ if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
 if not DATABASE_URL:
     DATABASE_URL = 'postgresql://localhost/hardware_finder'
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool (per worker process): connections kept open, extra ones
+# allowed under load, seconds a request waits for one before failing, max age
+# of a connection in seconds, and whether to test connections on checkout
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+# PostgreSQL statement_timeout in ms (0: none)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+# DB_PGBOUNCER=1 when DATABASE_URL points at PgBouncer in transaction pooling
+# mode: session state doesn't survive a transaction there, so the statement
+# timeout is set per transaction and session-level advisory locks aren't used
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '0') == '1'
+
+# Pool checkout counters, reported by pool_stats()
+_pool_stats = {'checkouts': 0, 'waited': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0}
+_pool_stats_lock = threading.Lock()
+# Checkouts slower than this count as having waited for a connection
+POOL_WAIT_THRESHOLD_MS = 1.0
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection, and
+    keeps the occupancy gauges current after every checkout and checkin.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            with _pool_stats_lock:
+                _pool_stats['timeouts'] += 1
+            raise
+        wait = time.perf_counter() - start
+        metrics.DB_POOL_WAIT.observe(wait)
+        wait_ms = wait * 1000
+        with _pool_stats_lock:
+            _pool_stats['checkouts'] += 1
+            _pool_stats['waited'] += wait_ms >= POOL_WAIT_THRESHOLD_MS
+            _pool_stats['wait_ms_total'] += wait_ms
+            _pool_stats['wait_ms_max'] = max(_pool_stats['wait_ms_max'], wait_ms)
+        metrics.set_pool_occupancy(self)
+        return conn
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        metrics.set_pool_occupancy(self)
+
+def _engine_options():
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DATABASE_URL.startswith('postgresql') and DB_STATEMENT_TIMEOUT_MS and not DB_PGBOUNCER:
+        # PgBouncer rejects unknown startup parameters, so this is only set on direct connections
+        options['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    return options
+
+engine = create_engine(DATABASE_URL, **_engine_options())
+metrics.set_pool_occupancy(engine.pool)
+
+if engine.dialect.name == 'postgresql' and DB_STATEMENT_TIMEOUT_MS and DB_PGBOUNCER:
+    @event.listens_for(engine, 'begin')
+    def _set_statement_timeout(conn):
+        # SET LOCAL lasts until the end of the transaction, which is all PgBouncer guarantees
+        timeout = conn.get_execution_options().get('statement_timeout', DB_STATEMENT_TIMEOUT_MS)
+        if timeout:
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+# Statement timings for /metrics; executemany batches are timed as one statement.
+# A connection runs one statement at a time, so one start time per connection is enough
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('query_start', None)
+    if start is not None:
+        metrics.DB_QUERY_DURATION.labels(metrics.db_operation(statement)).observe(time.perf_counter() - start)
+
+def pool_stats():
+    """Current pool occupancy and checkout wait counters since this process started."""
+    pool = engine.pool
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats['wait_ms_total'] = round(stats['wait_ms_total'], 2)
+    stats['wait_ms_max'] = round(stats['wait_ms_max'], 2)
+    stats['wait_ms_avg'] = round(stats['wait_ms_total'] / stats['checkouts'], 3) if stats['checkouts'] else 0
+    stats.update({
+        'pool_size': pool.size(),
+        'max_overflow': DB_MAX_OVERFLOW,
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow(),
+    })
+    return stats
+# expire_on_commit=False: async handlers keep using ORM objects after commit, and
+# expired attributes would otherwise trigger blocking reloads on the event loop
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 def get_db():
     db = SessionLocal()
@@ -24,7 +134,88 @@ def get_db():
     finally:
         db.close()
 
-def create_tables():
-    """Create all database tables"""
-    from models import Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+def with_session(fn, *args):
+    """fn(db, *args) on a session of its own, for concurrent tasks that can't share one."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+# Fixed advisory lock key serializing migrations when several workers start at once
+MIGRATION_LOCK_KEY = 7421001
+
+def run_migrations():
+    """
+    Bring the schema up to date (alembic upgrade head). A database whose tables
+    were created by the old create_all() startup, and so has no recorded
+    revision, is stamped with the initial revision first.
+
+    Through PgBouncer (DB_PGBOUNCER=1) workers are not serialized, as the
+    session-level lock can't be held there; run `alembic upgrade head` once
+    per deploy against the database directly and set RUN_MIGRATIONS=0.
+    """
+    from alembic import command
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alembic'))
+    config.attributes['configure_logger'] = False
+    lock = engine.dialect.name == 'postgresql' and not DB_PGBOUNCER
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Index builds on large tables take longer than the statement timeout allows
+            conn.execution_options(statement_timeout=0)
+            conn.exec_driver_sql('SET statement_timeout = 0')
+            conn.commit()
+        if lock:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+        try:
+            config.attributes['connection'] = conn
+            legacy = 'search_history' in inspect(conn).get_table_names()
+            current = MigrationContext.configure(conn).get_current_revision()
+            # Alembic has to own the transactions (0003 builds indexes outside one)
+            conn.commit()
+            if legacy and current is None:
+                command.stamp(config, '0001')
+            command.upgrade(config, 'head')
+        finally:
+            if lock:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+            if engine.dialect.name == 'postgresql':
+                # Back to the connection's default before it returns to the pool
+                conn.exec_driver_sql('RESET statement_timeout')
+                conn.commit()
+
+def advisory_lock_key(name):
+    """Signed 64-bit PostgreSQL advisory lock key for a hex digest such as a location_hash."""
+    key = int(name[:16], 16)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+def try_advisory_lock(key):
+    """
+    Take a session-level PostgreSQL advisory lock without waiting. Returns the
+    connection holding it (pass it to release_advisory_lock), or None if another
+    session holds the lock.
+    """
+    conn = engine.connect()
+    try:
+        acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': key}).scalar()
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+def release_advisory_lock(conn, key):
+    try:
+        conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': key})
+        conn.commit()
+    finally:
+        conn.close()
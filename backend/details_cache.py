@@ -0,0 +1,126 @@
+"""
+Persistent Place Details cache (place_details_cache table).
+
+Entries are keyed by place_id and the requested field mask, so a store that
+shows up in overlapping searches is looked up once per DETAILS_CACHE_TTL_DAYS
+for each distinct set of fields. Masks are normalized (order, whitespace and
+duplicates don't matter); long ones are stored as a hash.
+
+Settings (environment):
+- DETAILS_CACHE_TTL_DAYS: how long Place Details results are reused (default 30)
+
+All functions are blocking; call them through run_in_threadpool from async code.
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+import metrics
+from models import PlaceDetailsCache
+from upserts import dialect_insert
+
+DETAILS_CACHE_TTL_DAYS = float(os.getenv('DETAILS_CACHE_TTL_DAYS', '30'))
+MAX_FIELDS_KEY_LENGTH = 255
+
+# Per-process hit/miss counters, reported by /analytics/details-cache
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+def fields_key(fields):
+    """Normalized form of a comma-separated field mask."""
+    key = ','.join(sorted({field.strip() for field in fields.split(',') if field.strip()}))
+    if len(key) > MAX_FIELDS_KEY_LENGTH:
+        key = 'blake2b:' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return key
+
+def _count(hits, misses, expired=0):
+    """Count lookups; `misses` includes the `expired` ones."""
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+    metrics.count_cache('details', 'hit', hits)
+    metrics.count_cache('details', 'miss', misses - expired)
+    metrics.count_cache('details', 'expired', expired)
+
+def get_many(db, place_ids, fields, count=True, max_age=None):
+    """
+    Cached details for those of `place_ids` that have them, as {place_id: result}.
+    `count=False` leaves opportunistic lookups (that never fetch) out of the hit rate;
+    with `max_age` (a timedelta), entries cached longer ago than that count as expired.
+    """
+    wanted = list(dict.fromkeys(place_id for place_id in place_ids if place_id))
+    found = {}
+    expired = 0
+    if wanted:
+        rows = db.query(
+            PlaceDetailsCache.place_id, PlaceDetailsCache.result, PlaceDetailsCache.cached_at, PlaceDetailsCache.expires_at
+        ).filter(
+            PlaceDetailsCache.place_id.in_(wanted),
+            PlaceDetailsCache.fields == fields_key(fields)
+        ).all()
+        # End the read transaction so the connection isn't held during upstream calls
+        db.commit()
+        now = datetime.utcnow()
+        oldest = now - max_age if max_age is not None else None
+        found = {place_id: result for place_id, result, cached_at, expires_at in rows
+                 if expires_at > now and (oldest is None or cached_at > oldest)}
+        expired = len(rows) - len(found)
+    if count:
+        _count(len(found), len(wanted) - len(found), expired)
+    return found
+
+def save_many(db, fields, results):
+    """Cache {place_id: result} details fetched with `fields`; empty results (failed lookups) are skipped."""
+    now = datetime.utcnow()
+    key = fields_key(fields)
+    rows = [{
+        'place_id': place_id,
+        'fields': key,
+        'result': result,
+        'cached_at': now,
+        'expires_at': now + timedelta(days=DETAILS_CACHE_TTL_DAYS)
+    } for place_id, result in sorted(results.items()) if place_id and result]
+    if not rows:
+        return
+    insert = dialect_insert(db, PlaceDetailsCache)
+    stmt = insert.on_conflict_do_update(
+        index_elements=['place_id', 'fields'],
+        set_={column: insert.excluded[column] for column in ('result', 'cached_at', 'expires_at')}
+    )
+    db.execute(stmt, rows)
+    db.commit()
+
+def get_or_fetch(session_factory, place_id, fields, fetch):
+    """
+    For scripts outside the API: cached details for one place, or fetch() and
+    cache its result. Falls back to fetch() alone when the database can't be used.
+    """
+    db = session_factory()
+    try:
+        try:
+            cached = get_many(db, [place_id], fields).get(place_id)
+        except SQLAlchemyError as e:
+            print(f"Place Details cache unavailable, fetching directly: {e}")
+            return fetch()
+        if cached is not None:
+            return cached
+        result = fetch()
+        try:
+            save_many(db, fields, {place_id: result})
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"Could not cache details for {place_id}: {e}")
+        return result
+    finally:
+        db.close()
+
+def cache_stats():
+    """Hit/miss counts (per place_id looked up) and hit rate (%) since this process started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups * 100, 2) if lookups else 0
+    return stats
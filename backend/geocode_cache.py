@@ -0,0 +1,114 @@
+"""
+Persistent forward / reverse geocode cache (geocode_cache table).
+
+Forward lookups are keyed by a normalized form of the query, so "Tokyo",
+"tokyo " and "TOKYO," share one entry; each result is also stored under the
+normalized formatted_address Google returned, so "Tokyo, Japan" hits after
+"Tokyo" was looked up once. Reverse lookups are keyed by lat/lng rounded to
+GEOCODE_CACHE_LATLNG_DECIMALS (3 decimals = cells of roughly 110 m).
+
+Settings (environment):
+- GEOCODE_CACHE_TTL_DAYS: how long a geocode result is reused (default 90)
+- GEOCODE_CACHE_LATLNG_DECIMALS: rounding of reverse geocode keys (default 3)
+
+All functions are blocking; call them through run_in_threadpool from async code.
+"""
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import GeocodeCache
+
+GEOCODE_CACHE_TTL_DAYS = float(os.getenv('GEOCODE_CACHE_TTL_DAYS', '90'))
+GEOCODE_CACHE_LATLNG_DECIMALS = int(os.getenv('GEOCODE_CACHE_LATLNG_DECIMALS', '3'))
+MAX_KEY_LENGTH = 512
+
+# Per-process hit/miss counters, reported by /analytics/geocode-cache
+_stats = {'forward': {'hits': 0, 'misses': 0}, 'reverse': {'hits': 0, 'misses': 0}}
+_stats_lock = threading.Lock()
+
+def normalize_address(query):
+    """Case-fold, unify unicode forms, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize('NFKC', query).casefold()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+def address_key(query):
+    normalized = normalize_address(query or '')
+    key = f'address:{normalized}'
+    # Unusable queries (empty, or too long for the key column) are not cached
+    if not normalized or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+def latlng_key(lat, lng):
+    decimals = GEOCODE_CACHE_LATLNG_DECIMALS
+    return f'latlng:{round(float(lat), decimals):.{decimals}f},{round(float(lng), decimals):.{decimals}f}'
+
+def _count(kind, result):
+    with _stats_lock:
+        _stats[kind]['hits' if result == 'hit' else 'misses'] += 1
+    metrics.count_cache(f'geocode_{kind}', result)
+
+def _get(db, key, kind):
+    entry = None
+    result = 'miss'
+    if key:
+        entry = db.query(GeocodeCache).filter(GeocodeCache.cache_key == key).first()
+        # End the read transaction so the connection isn't held during upstream calls
+        db.commit()
+        if entry is not None:
+            result = 'hit' if entry.expires_at > datetime.utcnow() else 'expired'
+    _count(kind, result)
+    return entry.result if result == 'hit' else None
+
+def _save(db, keys, query, result):
+    location = result.get('geometry', {}).get('location', {})
+    now = datetime.utcnow()
+    for key in dict.fromkeys(k for k in keys if k):
+        entry = GeocodeCache(
+            cache_key=key,
+            query=query[:255],
+            latitude=location.get('lat'),
+            longitude=location.get('lng'),
+            formatted_address=result.get('formatted_address'),
+            result=result,
+            cached_at=now,
+            expires_at=now + timedelta(days=GEOCODE_CACHE_TTL_DAYS)
+        )
+        try:
+            # merge() replaces an expired row; the savepoint absorbs a concurrent insert
+            with db.begin_nested():
+                db.merge(entry)
+        except IntegrityError:
+            pass
+    db.commit()
+
+def get_forward(db, query):
+    """Cached first Geocoding API result for an address query, or None."""
+    return _get(db, address_key(query), 'forward')
+
+def save_forward(db, query, result):
+    """Cache a forward geocode result under the query and its formatted_address."""
+    _save(db, [address_key(query), address_key(result.get('formatted_address'))], query, result)
+
+def get_reverse(db, lat, lng):
+    """Cached first reverse geocode result for the cell containing lat/lng, or None."""
+    return _get(db, latlng_key(lat, lng), 'reverse')
+
+def save_reverse(db, lat, lng, result):
+    _save(db, [latlng_key(lat, lng)], f'{lat},{lng}', result)
+
+def cache_stats():
+    """Hit/miss counts and hit rate (%) per lookup kind since this process started."""
+    with _stats_lock:
+        stats = {kind: dict(counts) for kind, counts in _stats.items()}
+    for counts in stats.values():
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / lookups * 100, 2) if lookups else 0
+    return stats
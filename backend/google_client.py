@@ -0,0 +1,263 @@
+"""
+Shared clients for Google Maps / Places web service calls.
+
+Both clients keep pooled keep-alive connections to googleapis.com, retry 429 and
+5xx responses (and connection errors) with exponential backoff, and apply a
+per-endpoint timeout. The backend uses AsyncGoogleClient (aiohttp); the batch
+scripts in src/ use the synchronous GoogleClient (httpx, HTTP/2 when the `h2`
+package is installed). Every request is metered, and may be refused, by
+api_usage (budgets are set there).
+
+Settings (environment):
+- GOOGLE_POOL_SIZE: max pooled connections per client (default 100)
+- GOOGLE_KEEPALIVE_TIMEOUT: seconds an idle connection is kept open (default 30)
+- GOOGLE_HTTP2: set to 0 to disable HTTP/2 in the sync client (default 1)
+- GOOGLE_MAX_RETRIES: retries after the first attempt (default 3)
+- GOOGLE_RETRY_BACKOFF: base backoff in seconds, doubled per retry (default 0.5)
+- GOOGLE_TIMEOUT_<ENDPOINT>: timeout in seconds for one endpoint, e.g.
+  GOOGLE_TIMEOUT_DETAILS=5 (defaults in ENDPOINT_TIMEOUTS)
+- GOOGLE_PAGETOKEN_DELAY: seconds before the first use of a Nearby Search
+  next_page_token (default 1)
+- GOOGLE_PAGETOKEN_POLL: first wait in seconds before retrying a token that
+  isn't valid yet (INVALID_REQUEST), doubled per retry up to 1 s (default 0.25)
+- GOOGLE_PAGETOKEN_MAX_WAIT: seconds after which a token that still isn't
+  valid is given up on (default 10)
+"""
+import asyncio
+import os
+import random
+import time
+
+# The backend only installs aiohttp and the batch scripts only install httpx
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+# Upstream metrics are only collected in the backend; the batch scripts don't install prometheus_client
+try:
+    import metrics
+except ImportError:
+    metrics = None
+
+import api_usage
+import timing
+
+POOL_SIZE = int(os.getenv('GOOGLE_POOL_SIZE', '100'))
+KEEPALIVE_TIMEOUT = float(os.getenv('GOOGLE_KEEPALIVE_TIMEOUT', '30'))
+HTTP2_ENABLED = os.getenv('GOOGLE_HTTP2', '1') == '1'
+MAX_RETRIES = int(os.getenv('GOOGLE_MAX_RETRIES', '3'))
+RETRY_BACKOFF = float(os.getenv('GOOGLE_RETRY_BACKOFF', '0.5'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A next_page_token only becomes valid a short, unspecified time after it is
+# issued; using it earlier returns INVALID_REQUEST, so it is polled for instead
+# of waiting a fixed 2 s
+PAGETOKEN_DELAY = float(os.getenv('GOOGLE_PAGETOKEN_DELAY', '1'))
+PAGETOKEN_POLL = float(os.getenv('GOOGLE_PAGETOKEN_POLL', '0.25'))
+PAGETOKEN_MAX_POLL = 1.0
+PAGETOKEN_MAX_WAIT = float(os.getenv('GOOGLE_PAGETOKEN_MAX_WAIT', '10'))
+
+# Default timeouts in seconds, keyed by the endpoint name callers pass in
+ENDPOINT_TIMEOUTS = {
+    'geocode': 10,
+    'reverse_geocode': 10,
+    'nearby': 10,
+    'details': 10,
+    'text_search': 30,
+}
+DEFAULT_TIMEOUT = 10
+
+def endpoint_timeout(endpoint):
+    """Timeout in seconds for an endpoint, overridable with GOOGLE_TIMEOUT_<ENDPOINT>."""
+    override = os.getenv(f'GOOGLE_TIMEOUT_{endpoint.upper()}')
+    if override:
+        return float(override)
+    return ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+
+def retry_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number `attempt` (0-based), honouring Retry-After."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random() / 2)
+
+def pagetoken_delays():
+    """
+    Seconds to wait before each attempt to use a fresh next_page_token: the
+    first attempt after PAGETOKEN_DELAY, then retries (while the response is
+    INVALID_REQUEST) with backoff, PAGETOKEN_MAX_WAIT seconds in total.
+    """
+    waited = PAGETOKEN_DELAY
+    yield PAGETOKEN_DELAY
+    poll = PAGETOKEN_POLL
+    while waited < PAGETOKEN_MAX_WAIT:
+        delay = min(poll, PAGETOKEN_MAX_WAIT - waited)
+        yield delay
+        waited += delay
+        poll = min(poll * 2, PAGETOKEN_MAX_POLL)
+
+def _drop_none(params):
+    # Unset values (e.g. a missing API key) are left out, as requests did
+    if params is None:
+        return None
+    return {k: v for k, v in params.items() if v is not None}
+
+class GoogleClient:
+    """
+    Synchronous pooled client. Returns the final httpx.Response without raising
+    on HTTP status, so callers can keep inspecting `status_code` themselves.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES, http2=HTTP2_ENABLED, verify=True):
+        self.max_retries = max_retries
+        self._client = httpx.Client(
+            http2=http2 and H2_AVAILABLE,
+            verify=verify,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=KEEPALIVE_TIMEOUT,
+            ),
+        )
+
+    def request(self, endpoint, method, url, params=None, timeout=None, **kwargs):
+        timeout = timeout or endpoint_timeout(endpoint)
+        for attempt in range(self.max_retries + 1):
+            api_usage.charge(endpoint, url)
+            try:
+                response = self._client.request(method, url, params=_drop_none(params), timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+            time.sleep(delay)
+
+    def get(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'GET', url, **kwargs)
+
+    def post(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'POST', url, **kwargs)
+
+    def close(self):
+        self._client.close()
+
+class AsyncGoogleClient:
+    """
+    Asynchronous pooled client on a single aiohttp session. `start()` must be
+    awaited inside the running event loop (e.g. on app startup) before use.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self._session = None
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_json(self, endpoint, url, params=None, timeout=None, **kwargs):
+        """GET a JSON endpoint and return the decoded body; raises on a final HTTP error."""
+        if metrics is None:
+            return await self._get_json(endpoint, url, params, timeout, **kwargs)
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            data = await self._get_json(endpoint, url, params, timeout, **kwargs)
+            outcome = 'ok'
+            return data
+        except aiohttp.ClientResponseError:
+            outcome = 'http_error'
+            raise
+        except api_usage.BudgetExceeded:
+            outcome = 'refused'
+            raise
+        finally:
+            metrics.UPSTREAM_REQUESTS.labels(endpoint, outcome).inc()
+            metrics.UPSTREAM_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+
+    async def _get_json(self, endpoint, url, params=None, timeout=None, **kwargs):
+        client_timeout = aiohttp.ClientTimeout(total=timeout or endpoint_timeout(endpoint))
+        params = _drop_none(params)
+        for attempt in range(self.max_retries + 1):
+            # Every attempt is metered and counts towards the current search's upstream calls
+            api_usage.charge(endpoint, url)
+            timing.count_upstream_call()
+            try:
+                async with self._session.get(url, params=params, timeout=client_timeout, **kwargs) as resp:
+                    if resp.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                        resp.raise_for_status()
+                        return await resp.json()
+                    delay = retry_delay(attempt, resp.headers.get('Retry-After'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(attempt)
+            if metrics is not None:
+                metrics.UPSTREAM_RETRIES.labels(endpoint).inc()
+            await asyncio.sleep(delay)
+
+class TokenBucket:
+    """
+    Async token bucket: refills `rate` tokens per second up to `capacity`, and
+    acquire() waits until a token is available. Not shared across processes.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; returns False instead of waiting."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+_client = None
+
+def get_client():
+    """Process-wide synchronous client, created on first use. Its calls are metered as this script's crawl."""
+    global _client
+    if _client is None:
+        _client = GoogleClient()
+        api_usage.start_crawl()
+    return _client
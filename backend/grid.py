@@ -0,0 +1,105 @@
+"""
+Search-area geometry for /bulk_search: the fixed lattice of query points and
+the adaptive quadtree cells that are split only where results saturate.
+"""
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+# Nearby Search rejects radii above 50 km
+MAX_NEARBY_RADIUS_M = 50000
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def haversine_np(lat1, lng1, lat2, lng2):
+    """Vectorized great-circle distance in meters; arguments broadcast like NumPy arrays."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lng2 - lng1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def generate_grid_points(center, radius, spacing, packing='square'):
+    """
+    Lattice points within `radius` meters of `center`, row by row from the south-west.
+
+    'square' places points `spacing` meters apart. 'hex' offsets every other row
+    by half a step and widens the step so the worst-case distance from any
+    location to its nearest point (spacing / sqrt(2)) is the same as for the
+    square lattice, which needs ~23% fewer points for the same coverage.
+    """
+    clat, clng = center
+    cos_clat = math.cos(math.radians(clat))
+    if packing == 'hex':
+        step = spacing * math.sqrt(1.5)
+        row_step = step * math.sqrt(3) / 2
+    else:
+        step = row_step = spacing
+    dlat = math.degrees(row_step / EARTH_RADIUS_M)
+    dlng = math.degrees(step / (EARTH_RADIUS_M * cos_clat))
+    lat_extent = math.degrees(radius / EARTH_RADIUS_M)
+    lng_extent = math.degrees(radius / (EARTH_RADIUS_M * cos_clat))
+
+    # The small epsilon keeps the far edge when the extent is an exact multiple of the step
+    lats = clat - lat_extent + np.arange(int(2 * lat_extent / dlat + 1e-9) + 1) * dlat
+    lngs = clng - lng_extent + np.arange(int(2 * lng_extent / dlng + 1e-9) + 1) * dlng
+    if packing == 'hex':
+        # Shifted rows need one extra column on the west side to cover the edge
+        lngs = np.append(lngs[0] - dlng, lngs)
+    lat_grid, lng_grid = np.meshgrid(lats, lngs, indexing='ij')
+    if packing == 'hex':
+        lng_grid[1::2] += dlng / 2
+
+    mask = haversine_np(clat, clng, lat_grid, lng_grid) <= radius
+    return list(zip(lat_grid[mask].tolist(), lng_grid[mask].tolist()))
+
+class Cell(NamedTuple):
+    """A square quadtree cell: center, half side length and the query radius covering it."""
+    lat: float
+    lng: float
+    half_size: float
+    radius: float
+    depth: int
+
+def root_cells(center, radius):
+    """
+    Cells to start an adaptive search with: one circle equal to the search
+    area, or - when that exceeds the Nearby Search radius limit - its
+    quadtree descendants small enough to be queried.
+    """
+    clat, clng = center
+    pending = [Cell(clat, clng, radius, radius, 0)]
+    cells = []
+    while pending:
+        cell = pending.pop()
+        if cell.radius <= MAX_NEARBY_RADIUS_M:
+            cells.append(cell)
+        else:
+            pending.extend(split_cell(cell, center, radius))
+    return cells
+
+def split_cell(cell, center, radius):
+    """
+    The four quadrants of a cell that still overlap the search circle. Each
+    child's query radius is its circumscribed circle (half diagonal).
+    """
+    half = cell.half_size / 2
+    child_radius = half * math.sqrt(2)
+    dlat = math.degrees(half / EARTH_RADIUS_M)
+    children = []
+    for sy in (-1, 1):
+        lat = cell.lat + sy * dlat
+        dlng = math.degrees(half / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+        for sx in (-1, 1):
+            lng = cell.lng + sx * dlng
+            if haversine_m(center[0], center[1], lat, lng) <= radius + child_radius:
+                children.append(Cell(lat, lng, half, child_radius, cell.depth + 1))
+    return children
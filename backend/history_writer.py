@@ -0,0 +1,160 @@
+"""
+Background writer for search_history.
+
+/search hands each finished search to record() as a dict and returns without
+touching the database; a daemon thread drains the queue and writes up to
+HISTORY_BATCH_SIZE searches per transaction: one multi-row INSERT into
+search_history, their search_stores links and one aggregated rollup upsert.
+
+Settings (environment):
+- HISTORY_QUEUE_SIZE: searches buffered per worker before the overflow policy applies (default 10000)
+- HISTORY_BATCH_SIZE: max searches written per transaction (default 500)
+- HISTORY_FLUSH_INTERVAL: max seconds a search waits in the buffer (default 1)
+- HISTORY_OVERFLOW: what to do when the buffer is full: 'drop' the new
+  search, 'drop_oldest' buffered search, or 'sync' write it from the request (default 'drop')
+
+Buffered searches are flushed on shutdown; searches still buffered when a
+worker is killed are lost.
+"""
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+from models import SearchHistory
+from rollups import record_searches
+from upserts import link_stores
+
+HISTORY_QUEUE_SIZE = int(os.getenv('HISTORY_QUEUE_SIZE', '10000'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '500'))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1'))
+HISTORY_OVERFLOW = os.getenv('HISTORY_OVERFLOW', 'drop')
+OVERFLOW_POLICIES = ('drop', 'drop_oldest', 'sync')
+
+# Longest the thread blocks on the queue before checking for shutdown
+STOP_POLL_SECONDS = 0.1
+
+HISTORY_COLUMNS = ('location', 'search_timestamp', 'user_ip', 'search_status', 'store_count', 'response_time_ms',
+                   'cache_ms', 'geocode_ms', 'nearby_ms', 'pagetoken_wait_ms', 'details_ms', 'save_ms', 'upstream_calls')
+
+def write_searches(db, searches):
+    """
+    Insert search_history rows for `searches` (dicts with HISTORY_COLUMNS and
+    optionally the `store_ids` the search saved), link their stores and count
+    them in the rollups. Does not commit.
+    """
+    rows = [{column: search.get(column) for column in HISTORY_COLUMNS} for search in searches]
+    # executemany with RETURNING, in parameter order so ids line up with searches
+    stmt = insert(SearchHistory).returning(SearchHistory.id, sort_by_parameter_order=True)
+    search_ids = db.execute(stmt, rows).scalars().all()
+    for search_id, search in zip(search_ids, searches):
+        link_stores(db, search_id, search.get('store_ids'))
+    record_searches(db, searches)
+    return search_ids
+
+class HistoryWriter:
+    """Bounded in-process buffer of finished searches, written in batches by a daemon thread."""
+
+    def __init__(self, session_factory, maxsize=HISTORY_QUEUE_SIZE, batch_size=HISTORY_BATCH_SIZE,
+                 flush_interval=HISTORY_FLUSH_INTERVAL, overflow=HISTORY_OVERFLOW):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"HISTORY_OVERFLOW must be one of {', '.join(OVERFLOW_POLICIES)}, not {overflow!r}")
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._queue = queue.Queue(max(1, maxsize))
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {'written': 0, 'dropped': 0, 'failed': 0, 'written_inline': 0}
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=30):
+        """Write everything still buffered and stop the thread. Blocking."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    async def record(self, search):
+        """Buffer a finished search; applies the overflow policy when the buffer is full."""
+        if self._thread is not None:
+            try:
+                self._queue.put_nowait(search)
+                return
+            except queue.Full:
+                pass
+        if self.overflow == 'sync' or self._thread is None:
+            await run_in_threadpool(self._flush, [search], 'written_inline')
+        elif self.overflow == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(search)
+            except queue.Full:
+                self._count('dropped')
+        else:
+            self._count('dropped')
+
+    def stats(self):
+        """Counts since this process started, and searches waiting in the queue (not counting a batch being collected)."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+        metrics.HISTORY_ROWS.labels(key).inc(n)
+
+    def _next_batch(self):
+        """Up to batch_size searches, waiting at most flush_interval after the first one."""
+        try:
+            batch = [self._queue.get(timeout=STOP_POLL_SECONDS)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if self._stopping.is_set() or remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=min(remaining, STOP_POLL_SECONDS)))
+            except queue.Empty:
+                if self._stopping.is_set() or remaining <= 0:
+                    break
+        return batch
+
+    def _flush(self, batch, counter='written'):
+        db = self.session_factory()
+        try:
+            write_searches(db, batch)
+            db.commit()
+            self._count(counter, len(batch))
+        except Exception as e:
+            db.rollback()
+            self._count('failed', len(batch))
+            print(f"Writing {len(batch)} search history rows failed: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
@@ -1,5 +1,6 @@
 import os
-import requests
+import asyncio
+import aiohttp
 from fastapi import FastAPI, Query, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -7,22 +8,95 @@ from typing import List, Optional
 from pydantic import BaseModel
 import time
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db, create_tables
-from models import SearchHistory, Store as StoreModel, LocationCache
+from sqlalchemy import select, tuple_
+from database import SessionLocal, with_session, engine, get_db, run_migrations, advisory_lock_key, try_advisory_lock, release_advisory_lock, pool_stats, DB_PGBOUNCER
+import geocode_cache
+import nearby_cache
+import details_cache
+from cache import LRUCache, SingleFlight
+from responses import dumps, encode_search, search_response
+from rollups import popular_locations, record_new_stores, search_stats
+from history_writer import HistoryWriter
+import api_usage
+import metrics
+import timing
+from metrics import MetricsMiddleware
+from upserts import upsert_stores
+from google_client import AsyncGoogleClient, TokenBucket, pagetoken_delays
+from grid import MAX_NEARBY_RADIUS_M, Cell, generate_grid_points, root_cells, split_cell
+from spatial import stores_near
+from models import SearchHistory, LocationCache
 import hashlib
 from datetime import datetime, timedelta
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import json
-import math
 
 load_dotenv()
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
 print("Loaded API KEY:", API_KEY)
 
-GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
-PLACES_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
-DETAILS_URL = 'https://maps.googleapis.com/maps/api/place/details/json'
+RUN_MIGRATIONS = os.getenv('RUN_MIGRATIONS', '1') == '1'
+
+# Overridable so the backend can be pointed at a local fake API (see benchmarks/)
+GOOGLE_MAPS_BASE_URL = os.getenv('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com').rstrip('/')
+GEOCODE_URL = f'{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json'
+PLACES_URL = f'{GOOGLE_MAPS_BASE_URL}/maps/api/place/nearbysearch/json'
+DETAILS_URL = f'{GOOGLE_MAPS_BASE_URL}/maps/api/place/details/json'
+DETAILS_FIELDS = 'name,formatted_phone_number,website,formatted_address,types,international_phone_number'
+
+# Place Details fan-out: max concurrent lookups and overall budget (s) for all
+# lookups belonging to one search (per-call timeout: GOOGLE_TIMEOUT_DETAILS)
+DETAILS_CONCURRENCY = int(os.getenv('DETAILS_CONCURRENCY', '10'))
+DETAILS_TOTAL_TIMEOUT = float(os.getenv('DETAILS_TOTAL_TIMEOUT', '20'))
+
+# Bulk search: default / max grid points in flight per request, and the
+# token-bucket rate (calls/s) and burst size for its Nearby Search calls
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '5'))
+BULK_MAX_CONCURRENCY = int(os.getenv('BULK_MAX_CONCURRENCY', '20'))
+BULK_RATE_PER_SECOND = float(os.getenv('BULK_RATE_PER_SECOND', '10'))
+BULK_RATE_BURST = float(os.getenv('BULK_RATE_BURST', '10'))
+# Query radius used at every lattice point in grid mode
+GRID_QUERY_RADIUS_M = 10000
+# Nearby Search radius and place type for /search
+SEARCH_RADIUS_M = 10000
+PLACE_TYPE = 'hardware_store'
+# Adaptive mode: smallest cell radius worth splitting into, and a cap on cells per request
+ADAPTIVE_MIN_RADIUS_M = float(os.getenv('ADAPTIVE_MIN_RADIUS_M', '250'))
+ADAPTIVE_MAX_CELLS = int(os.getenv('ADAPTIVE_MAX_CELLS', '400'))
+
+# In-process cache of pre-encoded search responses in front of location_cache:
+# max entries per worker, and max seconds an entry is served without
+# re-checking the database (entries never outlive their expires_at)
+SEARCH_MEMORY_CACHE_SIZE = int(os.getenv('SEARCH_MEMORY_CACHE_SIZE', '1000'))
+SEARCH_MEMORY_CACHE_TTL = float(os.getenv('SEARCH_MEMORY_CACHE_TTL', '300'))
+search_cache = LRUCache(SEARCH_MEMORY_CACHE_SIZE, SEARCH_MEMORY_CACHE_TTL, name='search_memory')
+# Concurrent /search misses for one location share a single upstream fetch per
+# process; SEARCH_ADVISORY_LOCK=1 also serializes them across workers with a
+# PostgreSQL advisory lock (others poll location_cache for up to WAIT seconds)
+search_flights = SingleFlight()
+# Stale-while-revalidate: results older than SEARCH_SOFT_TTL_HOURS are still
+# served but refreshed in the background (location_cache.expires_at stays the
+# hard limit). Refreshes are capped in number running and started per minute,
+# and one entry is not refreshed again by this worker within SEARCH_REFRESH_LOCK_SECONDS
+SEARCH_SOFT_TTL_HOURS = float(os.getenv('SEARCH_SOFT_TTL_HOURS', '168'))
+SEARCH_REFRESH_CONCURRENCY = int(os.getenv('SEARCH_REFRESH_CONCURRENCY', '2'))
+SEARCH_REFRESH_PER_MINUTE = float(os.getenv('SEARCH_REFRESH_PER_MINUTE', '30'))
+SEARCH_REFRESH_LOCK_SECONDS = float(os.getenv('SEARCH_REFRESH_LOCK_SECONDS', '600'))
+refresh_semaphore = asyncio.Semaphore(SEARCH_REFRESH_CONCURRENCY)
+refresh_bucket = TokenBucket(SEARCH_REFRESH_PER_MINUTE / 60, max(1.0, SEARCH_REFRESH_CONCURRENCY))
+refresh_locks = {}
+refresh_tasks = set()
+# Session-level advisory locks can't be used through PgBouncer's transaction pooling
+SEARCH_ADVISORY_LOCK = os.getenv('SEARCH_ADVISORY_LOCK', '0') == '1' and not DB_PGBOUNCER
+SEARCH_ADVISORY_LOCK_WAIT = float(os.getenv('SEARCH_ADVISORY_LOCK_WAIT', '30'))
+SEARCH_ADVISORY_LOCK_POLL = 0.25
+# search_history rows are written in batches off the request path (see history_writer.py)
+history_writer = HistoryWriter(SessionLocal)
+
+# Shared pooled client for all Google calls, started on app startup
+google = AsyncGoogleClient()
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
 
 class Store(BaseModel):
     name: str
@@ -54,14 +128,382 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency per route for /metrics (outermost, so it times everything else)
+app.add_middleware(MetricsMiddleware)
 
-# Create database tables on startup
+# Apply database migrations on startup (set RUN_MIGRATIONS=0 to run `alembic upgrade head` separately)
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    await google.start()
+    if RUN_MIGRATIONS:
+        run_migrations()
+    history_writer.start()
+    api_usage.ledger.start(SessionLocal)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in refresh_tasks:
+        task.cancel()
+    await google.close()
+    await run_in_threadpool(history_writer.stop)
+    await run_in_threadpool(api_usage.ledger.stop)
+
+async def get_place_details(place_id, semaphore):
+    """Fetch Place Details for one place_id. Returns {} on any upstream failure; a spent budget raises BudgetExceeded."""
+    details_params = {
+        'place_id': place_id,
+        'fields': DETAILS_FIELDS,
+        'key': API_KEY
+    }
+    async with semaphore:
+        try:
+            details_data = await google.get_json('details', DETAILS_URL, details_params)
+        except UPSTREAM_ERRORS:
+            return {}
+    return details_data.get('result', {})
+
+async def iter_pages_with_details(db, pages, max_cache_age=None):
+    """
+    Pipeline Nearby Search pages into Place Details lookups. Yields ('page',
+    results) as each page of `pages` (an async iterator) arrives and ('details',
+    place_id, details) as each store's details are known: cached ones right
+    after their page, the rest as each lookup completes (at most
+    DETAILS_CONCURRENCY at a time). A page's lookups start as soon as it
+    arrives, so they run while the next page's token is being waited for.
+    Lookups that fail or are still running DETAILS_TOTAL_TIMEOUT after the
+    last page are not yielded; fetched details are cached once all are done.
+    Cached details older than `max_cache_age` (a timedelta) are fetched again.
+    """
+    events = asyncio.Queue()
+    semaphore = asyncio.Semaphore(DETAILS_CONCURRENCY)
+    lookups = set()
+    seen = set()
+    fetched = {}
+
+    async def lookup(place_id):
+        try:
+            details = await get_place_details(place_id, semaphore)
+        except api_usage.BudgetExceeded as e:
+            # Fails the search rather than caching it with details missing
+            await events.put(('error', e))
+            return
+        except Exception as e:
+            # e.g. a malformed response body: the store goes out without details
+            # instead of the search waiting for DETAILS_TOTAL_TIMEOUT
+            print(f"Place Details lookup for {place_id} failed: {e!r}")
+            details = {}
+        if details:
+            fetched[place_id] = details
+        await events.put(('fetched', place_id, details))
+
+    async def read_pages():
+        try:
+            async for page in pages:
+                place_ids = [place_id for place_id in dict.fromkeys(store_data.get('place_id') for store_data in page)
+                             if place_id and place_id not in seen]
+                seen.update(place_ids)
+                cached = await run_in_threadpool(details_cache.get_many, db, place_ids, DETAILS_FIELDS, True, max_cache_age)
+                await events.put(('page', page))
+                for place_id, details in cached.items():
+                    await events.put(('details', place_id, details))
+                lookups.update(asyncio.create_task(lookup(place_id)) for place_id in place_ids if place_id not in cached)
+        except Exception as e:
+            await events.put(('error', e))
+        else:
+            await events.put(('pages_done',))
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.create_task(read_pages())
+    finished = 0
+    deadline = None
+    try:
+        while deadline is None or finished < len(lookups):
+            if deadline is None:
+                event = await events.get()
+            else:
+                try:
+                    event = await asyncio.wait_for(events.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+            if event[0] == 'error':
+                # Keep the lookups that already finished; they were paid for
+                await run_in_threadpool(details_cache.save_many, db, DETAILS_FIELDS, fetched)
+                raise event[1]
+            if event[0] == 'pages_done':
+                deadline = loop.time() + DETAILS_TOTAL_TIMEOUT
+            elif event[0] == 'fetched':
+                finished += 1
+                if event[2]:
+                    yield 'details', event[1], event[2]
+            else:
+                yield event
+    finally:
+        reader.cancel()
+        for task in lookups:
+            task.cancel()
+    await run_in_threadpool(details_cache.save_many, db, DETAILS_FIELDS, fetched)
+
+def find_cached_result(db, location_hash):
+    cached_result = db.query(LocationCache).filter(LocationCache.location_hash == location_hash).first()
+    # End the read transaction so the connection isn't held during upstream calls
+    db.commit()
+    if cached_result is None:
+        metrics.count_cache('location', 'miss')
+    elif cached_result.expires_at <= datetime.utcnow():
+        metrics.count_cache('location', 'expired')
+        return None
+    else:
+        metrics.count_cache('location', 'hit')
+    return cached_result
+
+def save_stores(db, stores):
+    """Upsert stores without linking them to a search (history_writer does that). Returns their ids."""
+    store_ids, new_stores = upsert_stores(db, None, stores)
+    record_new_stores(db, new_stores)
+    return store_ids
+
+async def load_cached_search(db, location_hash):
+    """Encoded search from the location_cache table (cached in memory too), or None."""
+    cached_result = await run_in_threadpool(find_cached_result, db, location_hash)
+    if not cached_result:
+        return None
+    # Stored results were built from validated Store models; encode them as-is
+    cached = encode_search(cached_result.results, cached_result.cached_at)
+    search_cache.set(location_hash, cached, cached_result.expires_at)
+    return cached
+
+async def find_cached_search(db, location_hash):
+    """Encoded search from this process's memory or the location_cache table, or None."""
+    cached = search_cache.get(location_hash)
+    if cached is None:
+        cached = await load_cached_search(db, location_hash)
+    return cached
+
+def is_stale(cached):
+    """Past the soft TTL: still served, but due for a background refresh."""
+    if cached.cached_at is None:
+        return False
+    return cached.cached_at + timedelta(hours=SEARCH_SOFT_TTL_HOURS) <= datetime.utcnow()
+
+async def get_nearby_page(params):
+    try:
+        return await google.get_json('nearby', PLACES_URL, params)
+    except UPSTREAM_ERRORS as e:
+        raise HTTPException(status_code=502, detail=f"Places API request failed: {e}")
+
+async def iter_nearby_pages(point):
+    """
+    Yield each page of Nearby Search results for a nearby_cache query point.
+    A next_page_token is polled for (see pagetoken_delays) until Google accepts
+    it; failures raise HTTPException.
+    """
+    params = {
+        'location': f'{point.lat},{point.lng}',
+        'radius': point.query_radius,
+        'type': PLACE_TYPE,
+        'key': API_KEY
+    }
+    data = await get_nearby_page(params)
+    while True:
+        if data.get('status') not in ['OK', 'ZERO_RESULTS']:
+            raise HTTPException(status_code=502, detail=f"Places API error: {data.get('status')}")
+        
+        yield data.get('results', [])
+        next_page_token = data.get('next_page_token')
+        if not next_page_token:
+            break
+        params['pagetoken'] = next_page_token
+        for delay in pagetoken_delays():
+            with timing.phase('pagetoken'):
+                await asyncio.sleep(delay)
+            data = await get_nearby_page(params)
+            # INVALID_REQUEST: the token isn't valid yet
+            if data.get('status') != 'INVALID_REQUEST':
+                break
+
+def store_from(store_data, details):
+    """Store for a Nearby Search result, with whatever of its Place Details are known."""
+    return Store(
+        name=store_data.get('name', 'N/A'),
+        address=details.get('formatted_address', store_data.get('vicinity', 'N/A')),
+        website=details.get('website'),
+        phone=details.get('formatted_phone_number') or details.get('international_phone_number'),
+        email=None,  # Email not available from Google Places API
+        place_id=store_data.get('place_id'),
+        latitude=store_data.get('geometry', {}).get('location', {}).get('lat'),
+        longitude=store_data.get('geometry', {}).get('location', {}).get('lng')
+    )
+
+async def search_events(db, location, location_hash, history=None, max_cache_age=None):
+    """
+    Geocode, page through Nearby Search and fetch details for one location, then
+    save the stores and the location_cache row. Yields progress as it goes:
+    ('stores', offset, [Store]) for each page of results (with any details
+    already known),
+    ('details', index, Store) each time a store's details arrive, and finally
+    ('done', encoded response). Upstream failures raise HTTPException. The
+    saved store ids are put in `history['store_ids']`, so the search's
+    history row gets linked to them. Nearby Search and Place Details cache
+    entries older than `max_cache_age` (a timedelta) are not reused.
+    """
+    # Geocode location (geocode cache first)
+    with timing.phase('geocode'):
+        geo_result = await run_in_threadpool(geocode_cache.get_forward, db, location)
+        if geo_result is None:
+            geo_params = {'address': location, 'key': API_KEY}
+            try:
+                geo_data = await google.get_json('geocode', GEOCODE_URL, geo_params)
+            except UPSTREAM_ERRORS as e:
+                raise HTTPException(status_code=502, detail=f"Geocoding API request failed: {e}")
+            
+            if geo_data.get('status') != 'OK' or not geo_data.get('results'):
+                raise HTTPException(status_code=400, detail=f"Geocoding failed: {geo_data.get('status')}")
+            
+            geo_result = geo_data['results'][0]
+            await run_in_threadpool(geocode_cache.save_forward, db, location, geo_result)
+    
+    loc = geo_result['geometry']['location']
+    lat, lng = loc['lat'], loc['lng']
+
+    # Find hardware stores (Nearby Search cache first: shared by every query centered in the same cell)
+    point = nearby_cache.query_point(lat, lng, SEARCH_RADIUS_M)
+    nearby_start = last_page_at = time.perf_counter()
+    cached_nearby = await run_in_threadpool(nearby_cache.get, db, point, PLACE_TYPE, True, max_cache_age)
+    if cached_nearby is not None:
+        async def cached_pages():
+            yield cached_nearby[0]
+        pages = cached_pages()
+    else:
+        pages = iter_nearby_pages(point)
+
+    # Details for each page are fetched while the next one is requested (a place_id can appear more than once)
+    all_results = []
+    stores = []
+    indexes = {}
+    known = {}
+    async for event in iter_pages_with_details(db, pages, max_cache_age):
+        if event[0] == 'page':
+            last_page_at = time.perf_counter()
+            offset = len(all_results)
+            for index, store_data in enumerate(event[1], offset):
+                indexes.setdefault(store_data.get('place_id'), []).append(index)
+                stores.append(store_from(store_data, known.get(store_data.get('place_id'), {})))
+            all_results.extend(event[1])
+            yield 'stores', offset, stores[offset:]
+        else:
+            _, place_id, details = event
+            known[place_id] = details
+            for index in indexes[place_id]:
+                stores[index] = store_from(all_results[index], details)
+                yield 'details', index, stores[index]
+    # Details overlap the pages; only what's left after the last page counts as the details phase
+    timing.add('nearby', last_page_at - nearby_start)
+    timing.add('details', time.perf_counter() - last_page_at)
+    if cached_nearby is None:
+        with timing.phase('save'):
+            await run_in_threadpool(nearby_cache.save, db, point, PLACE_TYPE, all_results, True)
+    
+    if not all_results:
+        yield 'done', encode_search({'location': location, 'stores': []})
+        return
+    
+    with timing.phase('save'):
+        # Save stores to database: one upsert, so stores found by earlier searches are updated, not duplicated
+        store_ids = await run_in_threadpool(save_stores, db, [store.dict(exclude={'email'}) for store in stores])
+        if history is not None:
+            history['store_ids'] = store_ids
+    
+        # Cache the results for 1 month; merge() replaces an expired row for the same location
+        results = {'location': location, 'stores': [store.dict() for store in stores]}
+        encoded = encode_search(results)
+        cache_result = LocationCache(
+            location_hash=location_hash,
+            location=location,
+            results=results,
+            store_count=len(stores),
+            cached_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(days=30)
+        )
+        encoded = encoded._replace(cached_at=cache_result.cached_at)
+        await run_in_threadpool(db.merge, cache_result)
+    
+        await run_in_threadpool(db.commit)
+    # Replace this process's copy; other workers pick the refresh up within SEARCH_MEMORY_CACHE_TTL
+    search_cache.set(location_hash, encoded, cache_result.expires_at)
+    yield 'done', encoded
+
+async def fetch_search(db, location, location_hash, history=None, max_cache_age=None, on_event=None):
+    """
+    search_events run to completion: returns the encoded response. The
+    progress events before 'done' are passed to `on_event`, when given.
+    """
+    async for event in search_events(db, location, location_hash, history, max_cache_age):
+        if event[0] == 'done':
+            return event[1]
+        if on_event is not None:
+            on_event(event)
+
+async def fetch_search_once(location, location_hash, history=None, wait=True, max_cache_age=None, on_event=None):
+    """
+    fetch_search on its own session, so it outlives the request that started it.
+    With SEARCH_ADVISORY_LOCK on PostgreSQL only one worker fetches a location at
+    a time; the others wait for its location_cache row (up to SEARCH_ADVISORY_LOCK_WAIT),
+    or return None right away when `wait` is False.
+    """
+    db = SessionLocal()
+    lock = None
+    try:
+        if SEARCH_ADVISORY_LOCK and engine.dialect.name == 'postgresql':
+            lock_key = advisory_lock_key(location_hash)
+            deadline = time.monotonic() + SEARCH_ADVISORY_LOCK_WAIT
+            while True:
+                lock = await run_in_threadpool(try_advisory_lock, lock_key)
+                # Re-check the table: the worker holding the lock may just have written it
+                cached = await load_cached_search(db, location_hash)
+                if cached is not None and not is_stale(cached):
+                    return cached
+                if lock is not None or time.monotonic() >= deadline:
+                    break
+                if not wait:
+                    return None
+                await asyncio.sleep(SEARCH_ADVISORY_LOCK_POLL)
+        return await fetch_search(db, location, location_hash, history, max_cache_age, on_event)
+    finally:
+        if lock is not None:
+            await run_in_threadpool(release_advisory_lock, lock, lock_key)
+        await run_in_threadpool(db.close)
+
+async def refresh_search(location, location_hash):
+    # Started from a request's context: keep the refresh out of that request's timings and budget
+    timing.current.set(None)
+    api_usage.current.set(api_usage.Meter('refresh', api_usage.API_SEARCH_BUDGET))
+    async with refresh_semaphore:
+        try:
+            # Refreshed results are reset to a fresh cached_at: don't fill them from
+            # Nearby Search / Place Details entries older than the soft TTL
+            await fetch_search_once(location, location_hash, wait=False,
+                                    max_cache_age=timedelta(hours=SEARCH_SOFT_TTL_HOURS))
+        except Exception as e:
+            # The stale entry keeps being served until its hard expiry
+            print(f"Background refresh of {location!r} failed: {e}")
+
+def schedule_refresh(location, location_hash):
+    """Start a background refresh of a stale entry unless one was started recently or the rate is used up."""
+    now = time.monotonic()
+    if refresh_locks.get(location_hash, 0) > now:
+        return
+    if not refresh_bucket.try_acquire():
+        return
+    # Drop lapsed locks so the map stays as small as the set of recently refreshed entries
+    for key in [key for key, until in refresh_locks.items() if until <= now]:
+        del refresh_locks[key]
+    refresh_locks[location_hash] = now + SEARCH_REFRESH_LOCK_SECONDS
+    task = asyncio.create_task(refresh_search(location, location_hash))
+    refresh_tasks.add(task)
+    task.add_done_callback(refresh_tasks.discard)
 
 @app.get("/search", response_model=SearchResponse, summary="Search hardware stores by location", tags=["Search"])
-def search_hardware_stores(
+async def search_hardware_stores(
     location: str = Query(..., description="Address, city, or place to search for hardware stores"),
     request: Request = None,
     db: Session = Depends(get_db)
@@ -69,178 +511,203 @@ def search_hardware_stores(
     """
     Search for hardware stores near a given location using the Google Places API.
     Returns a list of stores with name, address, website, and phone number.
-    Saves search history and store data to database.
+    Saves store data to database; the search history row is written in the background.
+    Upstream calls are non-blocking; database work is offloaded to the threadpool.
+    Concurrent searches for the same location share one upstream fetch.
+    Results past the soft TTL are served as-is and refreshed in the background.
+    Results carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    A Server-Timing header breaks the time down by phase (see timing.py).
     """
     start_time = time.time()
-    
-    # Create search history record
-    search_record = SearchHistory(
-        location=location,
-        user_ip=request.client.host if request else None,
-        search_status='processing'
-    )
-    db.add(search_record)
-    db.commit()
+    search_timing = timing.SearchTiming()
+    timing_token = timing.current.set(search_timing)
+    meter_token = api_usage.current.set(api_usage.Meter('search', api_usage.API_SEARCH_BUDGET))
+    history = {
+        'location': location,
+        'search_timestamp': datetime.utcnow(),
+        'user_ip': request.client.host if request else None,
+        'search_status': 'error'
+    }
     
     try:
-        # Check cache first
+        # Check cache first: this process's memory, then the location_cache table
         location_hash = hashlib.md5(location.lower().encode()).hexdigest()
-        cached_result = db.query(LocationCache).filter(
-            LocationCache.location_hash == location_hash,
-            LocationCache.expires_at > datetime.utcnow()
-        ).first()
-        
-        if cached_result:
-            # Return cached result
-            search_record.search_status = 'success'
-            search_record.store_count = len(cached_result.results.get('stores', []))
-            search_record.response_time_ms = int((time.time() - start_time) * 1000)
-            db.commit()
-            return SearchResponse(**cached_result.results)
-        
-        # Geocode location
-        geo_params = {'address': location, 'key': API_KEY}
-        try:
-            geo_resp = requests.get(GEOCODE_URL, params=geo_params, timeout=10)
-            geo_resp.raise_for_status()
-        except requests.RequestException as e:
-            search_record.search_status = 'error'
-            db.commit()
-            raise HTTPException(status_code=502, detail=f"Geocoding API request failed: {e}")
-        
-        geo_data = geo_resp.json()
-        if geo_data.get('status') != 'OK' or not geo_data.get('results'):
-            search_record.search_status = 'error'
-            db.commit()
-            raise HTTPException(status_code=400, detail=f"Geocoding failed: {geo_data.get('status')}")
+        with timing.phase('cache'):
+            cached = await find_cached_search(db, location_hash)
         
-        loc = geo_data['results'][0]['geometry']['location']
-        lat, lng = loc['lat'], loc['lng']
-
-        # Find hardware stores
-        params = {
-            'location': f'{lat},{lng}',
-            'radius': 10000,
-            'type': 'hardware_store',
-            'key': API_KEY
-        }
-        all_results = []
-        next_page_token = None
-        while True:
-            if next_page_token:
-                params['pagetoken'] = next_page_token
-                time.sleep(2)
-            try:
-                resp = requests.get(PLACES_URL, params=params, timeout=10)
-                resp.raise_for_status()
-            except requests.RequestException as e:
-                search_record.search_status = 'error'
-                db.commit()
-                raise HTTPException(status_code=502, detail=f"Places API request failed: {e}")
-            
-            data = resp.json()
-            if data.get('status') not in ['OK', 'ZERO_RESULTS']:
-                search_record.search_status = 'error'
-                db.commit()
-                raise HTTPException(status_code=502, detail=f"Places API error: {data.get('status')}")
-            
-            results = data.get('results', [])
-            all_results.extend(results)
-            next_page_token = data.get('next_page_token')
-            if not next_page_token:
-                break
-        
-        if not all_results:
-            search_record.search_status = 'no_results'
-            search_record.store_count = 0
-            search_record.response_time_ms = int((time.time() - start_time) * 1000)
-            db.commit()
-            return SearchResponse(location=location, stores=[])
-
-        # Get details for each store
-        stores = []
-        for store_data in all_results:
-            name = store_data.get('name', 'N/A')
-            place_id = store_data.get('place_id')
-            details_params = {
-                'place_id': place_id,
-                'fields': 'name,formatted_phone_number,website,formatted_address,types,international_phone_number',
-                'key': API_KEY
-            }
-            try:
-                details_resp = requests.get(DETAILS_URL, params=details_params, timeout=10)
-                details_resp.raise_for_status()
-            except requests.RequestException:
-                details = {}
-            else:
-                details = details_resp.json().get('result', {})
-            
-            store = Store(
-                name=name,
-                address=details.get('formatted_address', store_data.get('vicinity', 'N/A')),
-                website=details.get('website'),
-                phone=details.get('formatted_phone_number') or details.get('international_phone_number'),
-                email=None,  # Email not available from Google Places API
-                place_id=place_id,
-                latitude=store_data.get('geometry', {}).get('location', {}).get('lat'),
-                longitude=store_data.get('geometry', {}).get('location', {}).get('lng')
+        if cached is None:
+            # Identical misses in flight wait for the first one's result
+            cached = await search_flights.do(
+                location_hash, lambda: fetch_search_once(location, location_hash, history)
             )
-            stores.append(store)
-            
-            # Save store to database
-            db_store = StoreModel(
-                search_id=search_record.id,
-                name=store.name,
-                address=store.address,
-                website=store.website,
-                phone=store.phone,
-                place_id=store.place_id,
-                latitude=store.latitude,
-                longitude=store.longitude
-            )
-            db.add(db_store)
-        
-        # Update search record with results
-        search_record.search_status = 'success'
-        search_record.store_count = len(stores)
-        search_record.response_time_ms = int((time.time() - start_time) * 1000)
-        
-        # Cache the results for 1 month
-        cache_result = LocationCache(
-            location_hash=location_hash,
-            location=location,
-            results={'location': location, 'stores': [store.dict() for store in stores]},
-            expires_at=datetime.utcnow() + timedelta(days=30)
-        )
-        db.add(cache_result)
+        elif is_stale(cached):
+            schedule_refresh(location, location_hash)
         
-        db.commit()
-        return SearchResponse(location=location, stores=stores)
+        history['search_status'] = 'success' if cached.store_count else 'no_results'
+        history['store_count'] = cached.store_count
+        response = search_response(cached, request)
+        response.headers['Server-Timing'] = search_timing.header()
+        return response
         
+    except HTTPException:
+        raise
+    except api_usage.BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
-        search_record.search_status = 'error'
-        db.commit()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        timing.current.reset(timing_token)
+        api_usage.current.reset(meter_token)
+        history['response_time_ms'] = int((time.time() - start_time) * 1000)
+        history.update(search_timing.history_columns())
+        await history_writer.record(history)
+
+def ndjson_line(obj):
+    return dumps(obj) + b'\n'
+
+@app.get("/search/stream", summary="Search hardware stores, streaming results as they arrive", tags=["Search"])
+async def stream_hardware_stores(
+    location: str = Query(..., description="Address, city, or place to search for hardware stores"),
+    request: Request = None
+):
+    """
+    Same search as /search, as NDJSON events so clients can show stores before
+    every Place Details lookup has finished:
+
+    - `{"event": "stores", "offset": n, "stores": [...]}` for each page of
+      Nearby Search results (address is the vicinity; no website or phone yet)
+    - `{"event": "details", "index": i, "store": {...}}` when a store's details arrive
+    - `{"event": "done", "store_count": n, "result": {"location", "stores"}}`
+      with the final response, which is all a cached search sends
+    - `{"event": "error", "status_code": ..., "detail": ...}` if the search fails
+
+    A cache miss shares /search's in-flight fetch for the location: when one
+    is already running (for /search or another stream) only its done event is
+    sent; otherwise this stream starts it and relays its progress. The fetch
+    runs on its own session and finishes even if the client disconnects.
+    """
+    start_time = time.time()
+    history = {
+        'location': location,
+        'search_timestamp': datetime.utcnow(),
+        'user_ip': request.client.host if request else None,
+        'search_status': 'error'
+    }
+    location_hash = hashlib.md5(location.lower().encode()).hexdigest()
+
+    async def events():
+        # Set here: the body is iterated in its own context, not the handler's
+        search_timing = timing.SearchTiming()
+        timing.current.set(search_timing)
+        api_usage.current.set(api_usage.Meter('search', api_usage.API_SEARCH_BUDGET))
+        db = SessionLocal()
+        try:
+            with timing.phase('cache'):
+                cached = await find_cached_search(db, location_hash)
+            if cached is not None and is_stale(cached):
+                schedule_refresh(location, location_hash)
+            if cached is None:
+                progress = asyncio.Queue()
+
+                async def fetch():
+                    try:
+                        return await fetch_search_once(location, location_hash, history, on_event=progress.put_nowait)
+                    finally:
+                        progress.put_nowait(None)
+
+                # Same key as /search, so identical misses from either endpoint share one fetch
+                flight, started = search_flights.start(location_hash, fetch)
+                while started and (event := await progress.get()) is not None:
+                    if event[0] == 'stores':
+                        _, offset, stores = event
+                        yield ndjson_line({'event': 'stores', 'offset': offset, 'stores': [store.dict() for store in stores]})
+                    else:
+                        _, index, store = event
+                        yield ndjson_line({'event': 'details', 'index': index, 'store': store.dict()})
+                cached = await asyncio.shield(flight)
+            history['search_status'] = 'success' if cached.store_count else 'no_results'
+            history['store_count'] = cached.store_count
+            # The encoded response is embedded as-is
+            yield b'{"event":"done","store_count":%d,"result":%s}\n' % (cached.store_count, cached.body)
+        except HTTPException as e:
+            yield ndjson_line({'event': 'error', 'status_code': e.status_code, 'detail': e.detail})
+        except api_usage.BudgetExceeded as e:
+            yield ndjson_line({'event': 'error', 'status_code': 429, 'detail': str(e)})
+        except Exception as e:
+            yield ndjson_line({'event': 'error', 'status_code': 500, 'detail': str(e)})
+        finally:
+            history['response_time_ms'] = int((time.time() - start_time) * 1000)
+            history.update(search_timing.history_columns())
+            await history_writer.record(history)
+            await run_in_threadpool(db.close)
+
+    # Cache-Control/X-Accel-Buffering keep proxies from holding events back
+    return StreamingResponse(
+        events(), media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 500
+
+def parse_bbox(bbox):
+    try:
+        south, west, north, east = (float(value) for value in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be south,west,north,east")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(status_code=400, detail="bbox is out of range")
+    return south, west, north, east
+
+@app.get("/stores/nearby", summary="Stored stores near a point", tags=["Search"])
+def get_nearby_stores(
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of the center"),
+    lng: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the center"),
+    radius: float = Query(1000, gt=0, le=MAX_NEARBY_RADIUS_M, description="Search radius in meters"),
+    bbox: Optional[str] = Query(None, description="south,west,north,east; replaces the radius, e.g. for a map view"),
+    limit: int = Query(NEARBY_DEFAULT_LIMIT, ge=1, le=NEARBY_MAX_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Stores already saved by earlier searches within `radius` meters of lat/lng,
+    or inside `bbox`, closest first (to lat/lng, or to the bbox center). Answered
+    from the stores table alone; no Google calls are made.
+    """
+    box = parse_bbox(bbox) if bbox else None
+    if lat is None or lng is None:
+        if box is None:
+            raise HTTPException(status_code=400, detail="lat and lng, or bbox, are required")
+        south, west, north, east = box
+        lat = (south + north) / 2
+        lng = (west + east) / 2 if west <= east else ((west + east + 360) / 2 + 180) % 360 - 180
+    nearby = stores_near(db, lat, lng, radius_m=None if box else radius, bbox=box, limit=limit)
+    stores = [{
+        "name": store.name,
+        "address": store.address,
+        "website": store.website,
+        "phone": store.phone,
+        "place_id": store.place_id,
+        "latitude": float(store.latitude),
+        "longitude": float(store.longitude),
+        "distance_m": round(distance, 1),
+    } for store, distance in nearby]
+    return Response(content=dumps({"count": len(stores), "stores": stores}), media_type='application/json')
 
 @app.get("/analytics/popular-searches", summary="Get most searched locations", tags=["Analytics"])
 def get_popular_searches(db: Session = Depends(get_db)):
-    """Get most searched locations"""
-    popular = db.query(SearchHistory.location, 
-                      func.count(SearchHistory.id).label('search_count'))\
-                .group_by(SearchHistory.location)\
-                .order_by(func.count(SearchHistory.id).desc())\
-                .limit(10)\
-                .all()
+    """Get most searched locations (from the location_search_counts rollup)"""
+    popular = popular_locations(db, limit=10)
     return [{"location": item.location, "search_count": item.search_count} for item in popular]
 
 @app.get("/analytics/search-stats", response_model=AnalyticsResponse, summary="Get search statistics", tags=["Analytics"])
-def get_search_stats(db: Session = Depends(get_db)):
-    """Get search statistics"""
-    total_searches = db.query(SearchHistory).count()
-    successful_searches = db.query(SearchHistory)\
-                           .filter(SearchHistory.search_status == 'success')\
-                           .count()
-    total_stores = db.query(StoreModel).count()
+def get_search_stats(
+    as_of: Optional[datetime] = Query(None, description="Only count searches and stores recorded up to the end of this hour (UTC)"),
+    db: Session = Depends(get_db)
+):
+    """Get search statistics (from the hourly search_stats_hourly rollup)"""
+    searches, total_stores = search_stats(db, as_of)
+    total_searches = sum(searches.values())
+    successful_searches = searches.get('success', 0)
     
     success_rate = (successful_searches / total_searches * 100) if total_searches > 0 else 0
     
@@ -251,13 +718,13 @@ def get_search_stats(db: Session = Depends(get_db)):
         success_rate=round(success_rate, 2)
     )
 
+def recent_searches_query(limit=20):
+    return select(SearchHistory).order_by(SearchHistory.search_timestamp.desc()).limit(limit)
+
 @app.get("/analytics/recent-searches", summary="Get recent searches", tags=["Analytics"])
 def get_recent_searches(db: Session = Depends(get_db)):
     """Get recent search history"""
-    recent = db.query(SearchHistory)\
-               .order_by(SearchHistory.search_timestamp.desc())\
-               .limit(20)\
-               .all()
+    recent = db.scalars(recent_searches_query()).all()
     
     return [{
         "id": item.id,
@@ -265,106 +732,333 @@ def get_recent_searches(db: Session = Depends(get_db)):
         "search_timestamp": item.search_timestamp,
         "search_status": item.search_status,
         "store_count": item.store_count,
-        "response_time_ms": item.response_time_ms
+        "response_time_ms": item.response_time_ms,
+        "timing_ms": {phase: getattr(item, column) for phase, column in timing.PHASE_COLUMNS.items()},
+        "upstream_calls": item.upstream_calls
     } for item in recent]
 
-@app.get("/analytics/cached-searches", summary="Get all cached searches", tags=["Analytics"])
-def get_cached_searches(db: Session = Depends(get_db)):
-    """Get all cached search results from the cache table."""
-    cached = db.query(LocationCache).order_by(LocationCache.cached_at.desc()).all()
-    return [
-        {
-            "location": item.location,
-            "cached_at": item.cached_at,
-            "expires_at": item.expires_at,
-            "store_count": len(item.results.get('stores', [])),
-            "results": item.results
-        }
-        for item in cached
-    ]
+CACHED_SEARCHES_PAGE_SIZE = 100
+CACHED_SEARCHES_MAX_PAGE_SIZE = 1000
+CACHED_SEARCHES_STREAM_BATCH = 500
+
+def cached_searches_query(summary, before=None):
+    """
+    location_cache rows newest first, as (location_hash, location, cached_at,
+    expires_at, store_count[, results]); `before` is a cursor from the previous page.
+    """
+    columns = [LocationCache.location_hash, LocationCache.location, LocationCache.cached_at,
+               LocationCache.expires_at, LocationCache.store_count]
+    if not summary:
+        columns.append(LocationCache.results)
+    query = select(*columns).order_by(LocationCache.cached_at.desc(), LocationCache.location_hash.desc())
+    if before:
+        try:
+            cached_at, location_hash = before.split('|', 1)
+            cursor = (datetime.fromisoformat(cached_at), location_hash)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(LocationCache.cached_at, LocationCache.location_hash) < cursor)
+    return query
+
+def cached_search_item(row):
+    item = {
+        "location": row.location,
+        "cached_at": row.cached_at,
+        "expires_at": row.expires_at,
+        "store_count": row.store_count,
+    }
+    if 'results' in row._fields:
+        item["results"] = row.results
+        # Rows cached before store_count existed and weren't backfilled
+        if item["store_count"] is None:
+            item["store_count"] = len((row.results or {}).get('stores', []))
+    return item
+
+def cursor_for(row):
+    return f'{row.cached_at.isoformat()}|{row.location_hash}'
+
+@app.get("/analytics/cached-searches", summary="Get cached searches", tags=["Analytics"])
+def get_cached_searches(
+    limit: int = Query(CACHED_SEARCHES_PAGE_SIZE, ge=1, le=CACHED_SEARCHES_MAX_PAGE_SIZE, description="Entries per page"),
+    before: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+    summary: bool = Query(False, description="Leave out the cached results and return only location, dates and store count"),
+    db: Session = Depends(get_db)
+):
+    """
+    Get cached search results from the cache table, newest first, one page at a
+    time. When more entries exist, the X-Next-Cursor header holds the `before`
+    value for the next page.
+    """
+    rows = db.execute(cached_searches_query(summary, before).limit(limit + 1)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers['X-Next-Cursor'] = cursor_for(rows[-1])
+    return Response(
+        content=dumps([cached_search_item(row) for row in rows]),
+        media_type='application/json',
+        headers=headers
+    )
+
+@app.get("/analytics/cached-searches/stream", summary="Stream all cached searches as NDJSON", tags=["Analytics"])
+def stream_cached_searches(
+    summary: bool = Query(True, description="Leave out the cached results"),
+):
+    """
+    All cached searches, newest first, one JSON object per line. Rows are read
+    from a server-side cursor in batches, so memory use doesn't grow with the table.
+    """
+    def rows():
+        with SessionLocal() as db:
+            result = db.execute(
+                cached_searches_query(summary),
+                execution_options={'stream_results': True, 'yield_per': CACHED_SEARCHES_STREAM_BATCH}
+            )
+            for row in result:
+                yield dumps(cached_search_item(row)) + b'\n'
+    return StreamingResponse(rows(), media_type='application/x-ndjson')
+
+@app.get("/analytics/geocode-cache", summary="Get geocode cache hit rates", tags=["Analytics"])
+def get_geocode_cache_stats():
+    """Forward and reverse geocode cache hits, misses and hit rate for this worker process."""
+    return geocode_cache.cache_stats()
+
+@app.get("/analytics/nearby-cache", summary="Get Nearby Search cache hit rate", tags=["Analytics"])
+def get_nearby_cache_stats():
+    """Nearby Search cache hits, misses and hit rate for this worker process."""
+    return nearby_cache.cache_stats()
+
+@app.get("/analytics/details-cache", summary="Get Place Details cache hit rate", tags=["Analytics"])
+def get_details_cache_stats():
+    """Place Details cache hits, misses and hit rate (per place looked up) for this worker process."""
+    return details_cache.cache_stats()
+
+@app.get("/analytics/history-writer", summary="Get search history writer counters", tags=["Analytics"])
+def get_history_writer_stats():
+    """Search history rows written, dropped on overflow, failed and still buffered in this worker process."""
+    return history_writer.stats()
+
+@app.get("/analytics/db-pool", summary="Get database connection pool usage", tags=["Analytics"])
+def get_db_pool_stats():
+    """Connections in use and idle, and how long checkouts waited for one, for this worker process."""
+    return pool_stats()
+
+@app.get("/analytics/api-usage", summary="Get Google API calls and budgets", tags=["Analytics"])
+def get_api_usage(days: int = Query(7, ge=1, le=90), db: Session = Depends(get_db)):
+    """
+    Metered Google API calls per UTC day, by SKU and by originating job, from
+    all processes sharing the database (as of their last flush), plus this
+    process's own counts and the configured budgets.
+    """
+    return {
+        'budgets': {
+            'daily': api_usage.API_DAILY_BUDGET or None,
+            'search': api_usage.API_SEARCH_BUDGET or None,
+            'bulk': api_usage.API_BULK_BUDGET or None,
+            'crawl': api_usage.API_CRAWL_BUDGET or None
+        },
+        'daily': api_usage.usage_by_day(db, days),
+        'process': api_usage.ledger.stats()
+    }
+
+@app.get("/metrics", summary="Prometheus metrics", tags=["Analytics"])
+def get_metrics():
+    """Request, upstream, cache and database metrics in Prometheus text format, for all workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    body, content_type = metrics.render()
+    # Passed as a header: media_type would append a second charset
+    return Response(content=body, headers={'Content-Type': content_type})
 
 @app.get("/bulk_search", summary="Bulk grid search with streaming results", tags=["Bulk"])
-def bulk_search(
+async def bulk_search(
     center: str = Query(..., description="[lat,lng] center of search, comma-separated"),
     radius: float = Query(5000, description="Radius in meters (default 5000m)"),
     spacing: float = Query(2000, description="Grid spacing in meters (default 2000m)"),
+    mode: str = Query('grid', pattern='^(grid|adaptive)$', description="'grid' for a fixed lattice, 'adaptive' to split cells only where results saturate"),
+    packing: str = Query('square', pattern='^(square|hex)$', description="Grid mode lattice: 'square', or 'hex' for ~23% fewer points with the same coverage"),
+    concurrency: int = Query(BULK_CONCURRENCY, ge=1, le=BULK_MAX_CONCURRENCY, description="Grid points searched in parallel"),
+    ordered: bool = Query(False, description="Stream results in grid order instead of as each point completes (grid mode only)"),
+    budget: Optional[int] = Query(None, ge=1, description="Max Google API calls for this job (default and cap: API_BULK_BUDGET)"),
     db: Session = Depends(get_db),
     request: Request = None
 ):
     """
     Streams hardware store search results for a grid of points within a circle.
     Deduplicates stores by place_id. Uses city name for search history.
+    Grid points are searched concurrently under a token-bucket rate limit.
+    In adaptive mode the search starts with one circle covering the whole area and
+    only splits a cell into four smaller ones when its query hits the result cap.
+    Once the job's Google API call budget (or the daily one) is spent, points not
+    yet sent to Google are cancelled and the stream ends with a `budget_exhausted` event.
     """
     # Parse center
     lat, lng = map(float, center.split(","))
     center_coords = [lat, lng]
-    def generate_grid_points(center, radius, spacing):
-        points = []
-        R = 6371000
-        clat, clng = center
-        dLat = spacing / R * (180 / math.pi)
-        dLng = spacing / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi)
-        for lat in frange(clat - radius / R * (180 / math.pi), clat + radius / R * (180 / math.pi), dLat):
-            for lng in frange(clng - radius / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi), clng + radius / (R * math.cos((math.pi * clat) / 180)) * (180 / math.pi), dLng):
-                d = R * math.acos(
-                    math.sin(clat * math.pi / 180) * math.sin(lat * math.pi / 180) +
-                    math.cos(clat * math.pi / 180) * math.cos(lat * math.pi / 180) * math.cos((lng - clng) * math.pi / 180)
-                )
-                if d <= radius:
-                    points.append((lat, lng))
-        return points
-    def frange(start, stop, step):
-        while start <= stop:
-            yield start
-            start += step
-    def stream():
-        seen_place_ids = set()
-        city_name = None
-        points = generate_grid_points(center_coords, radius, spacing)
-        for idx, (lat, lng) in enumerate(points):
-            # Reverse geocode for city name (only once, at center)
-            if idx == 0:
-                geo_params = {'latlng': f'{lat},{lng}', 'key': API_KEY}
-                try:
-                    geo_resp = requests.get(GEOCODE_URL, params=geo_params, timeout=10)
-                    geo_resp.raise_for_status()
-                    geo_data = geo_resp.json()
-                    if geo_data.get('status') == 'OK' and geo_data.get('results'):
-                        for comp in geo_data['results'][0].get('address_components', []):
-                            if 'locality' in comp['types']:
-                                city_name = comp['long_name']
-                                break
-                        if not city_name:
-                            city_name = geo_data['results'][0].get('formatted_address', f'{lat},{lng}')
-                    else:
-                        city_name = f'{lat},{lng}'
-                except Exception:
-                    city_name = f'{lat},{lng}'
-            # Search for hardware stores at this point
-            params = {
-                'location': f'{lat},{lng}',
-                'radius': 10000,
-                'type': 'hardware_store',
-                'key': API_KEY
-            }
+    if mode == 'adaptive':
+        cells = root_cells(center_coords, radius)
+        # Root cells can't be coarser (each is at the Nearby Search radius limit), so too many is an error
+        if len(cells) > ADAPTIVE_MAX_CELLS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"radius needs {len(cells)} cells at least, more than ADAPTIVE_MAX_CELLS ({ADAPTIVE_MAX_CELLS})"
+            )
+    else:
+        cells = [Cell(lat, lng, spacing / 2, GRID_QUERY_RADIUS_M, 0) for lat, lng in generate_grid_points(center_coords, radius, spacing, packing)]
+    async def reverse_geocode_city(lat, lng):
+        geo_result = await run_in_threadpool(geocode_cache.get_reverse, db, lat, lng)
+        if geo_result is None:
+            geo_params = {'latlng': f'{lat},{lng}', 'key': API_KEY}
             try:
-                resp = requests.get(PLACES_URL, params=params, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
-                stores = []
-                for store_data in data.get('results', []):
-                    place_id = store_data.get('place_id')
-                    if place_id and place_id not in seen_place_ids:
-                        seen_place_ids.add(place_id)
-                        stores.append({
-                            'name': store_data.get('name', 'N/A'),
-                            'address': store_data.get('vicinity', ''),
-                            'place_id': place_id,
-                            'latitude': store_data.get('geometry', {}).get('location', {}).get('lat'),
-                            'longitude': store_data.get('geometry', {}).get('location', {}).get('lng')
+                geo_data = await google.get_json('reverse_geocode', GEOCODE_URL, geo_params)
+            except Exception:
+                return f'{lat},{lng}'
+            if geo_data.get('status') != 'OK' or not geo_data.get('results'):
+                return f'{lat},{lng}'
+            geo_result = geo_data['results'][0]
+            await run_in_threadpool(geocode_cache.save_reverse, db, lat, lng, geo_result)
+        for comp in geo_result.get('address_components', []):
+            if 'locality' in comp['types']:
+                return comp['long_name']
+        return geo_result.get('formatted_address', f'{lat},{lng}')
+    # Tasks whose Nearby Search call has been sent (and paid for)
+    sent = set()
+    async def search_cell(idx, cell, semaphore, bucket):
+        # Search for hardware stores in this cell (first page only; cached ones don't count against the rate limit)
+        point = nearby_cache.query_point(cell.lat, cell.lng, cell.radius)
+        params = {
+            'location': f'{point.lat},{point.lng}',
+            'radius': point.query_radius,
+            'type': PLACE_TYPE,
+            'key': API_KEY
+        }
+        async with semaphore:
+            cached = await run_in_threadpool(with_session, nearby_cache.get, point, PLACE_TYPE)
+            if cached is not None:
+                results, saturated = nearby_cache.first_page(*cached)
+            else:
+                # Refuse before queueing for a rate-limit token once the budget is spent
+                try:
+                    api_usage.check()
+                except api_usage.BudgetExceeded as e:
+                    return idx, cell, [], False, e
+                await bucket.acquire()
+                sent.add(asyncio.current_task())
+                try:
+                    data = await google.get_json('nearby', PLACES_URL, params)
+                except Exception as e:
+                    return idx, cell, [], False, e
+                results = data.get('results', [])
+                # A next_page_token means the cell holds more results than one page returns
+                saturated = bool(data.get('next_page_token'))
+                if data.get('status') in ('OK', 'ZERO_RESULTS'):
+                    await run_in_threadpool(with_session, nearby_cache.save, point, PLACE_TYPE, results, not saturated)
+            # Contact details of stores /search already looked up (no Details calls are made here)
+            known = await run_in_threadpool(
+                with_session, details_cache.get_many, [result.get('place_id') for result in results], DETAILS_FIELDS, False
+            )
+        results = [dict(result, details=known[result['place_id']]) if result.get('place_id') in known else result for result in results]
+        return idx, cell, results, saturated, None
+    async def stream():
+        # Set here, where the body runs; the grid point tasks inherit it
+        meter = api_usage.Meter('bulk', api_usage.job_budget(budget, api_usage.API_BULK_BUDGET))
+        api_usage.current.set(meter)
+        seen_place_ids = set()
+        if not cells:
+            return
+        # Reverse geocode for city name (only once, at center)
+        city_name = await reverse_geocode_city(*center_coords)
+        semaphore = asyncio.Semaphore(concurrency)
+        bucket = TokenBucket(BULK_RATE_PER_SECOND, BULK_RATE_BURST)
+        tasks = [asyncio.create_task(search_cell(idx, cell, semaphore, bucket)) for idx, cell in enumerate(cells)]
+        total = len(tasks)
+        def event(idx, cell, results, saturated, error):
+            payload = {'lat': cell.lat, 'lng': cell.lng, 'city': city_name, 'index': idx, 'total': total}
+            if mode == 'adaptive':
+                payload.update({'radius': round(cell.radius), 'depth': cell.depth, 'saturated': saturated})
+            if error is not None:
+                payload.update({'stores': [], 'error': str(error)})
+                return f"data: {json.dumps(payload)}\n\n"
+            stores = []
+            for store_data in results:
+                place_id = store_data.get('place_id')
+                if place_id and place_id not in seen_place_ids:
+                    seen_place_ids.add(place_id)
+                    store = {
+                        'name': store_data.get('name', 'N/A'),
+                        'address': store_data.get('vicinity', ''),
+                        'place_id': place_id,
+                        'latitude': store_data.get('geometry', {}).get('location', {}).get('lat'),
+                        'longitude': store_data.get('geometry', {}).get('location', {}).get('lng')
+                    }
+                    details = store_data.get('details')
+                    if details:
+                        store.update({
+                            'address': details.get('formatted_address', store['address']),
+                            'website': details.get('website'),
+                            'phone': details.get('formatted_phone_number') or details.get('international_phone_number')
                         })
-                yield f"data: {json.dumps({'lat': lat, 'lng': lng, 'stores': stores, 'city': city_name})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'lat': lat, 'lng': lng, 'stores': [], 'error': str(e), 'city': city_name})}\n\n"
-            time.sleep(0.5)  # Throttle to avoid API rate limits
+                    stores.append(store)
+            payload['stores'] = stores
+            return f"data: {json.dumps(payload)}\n\n"
+        def budget_event(error, searched):
+            # A named event: clients that only handle plain messages just see the stream end
+            payload = {'detail': str(error), 'scope': error.scope, 'searched': searched,
+                       'skipped': total - searched, 'total': total, **meter.summary()}
+            return f"event: budget_exhausted\ndata: {json.dumps(payload)}\n\n"
+        # The first point refused by the budget ends the job: points whose call
+        # was already sent are still waited for, the rest cancelled, and a
+        # budget_exhausted summary ends the stream
+        exhausted = None
+        searched = 0
+        remaining = []
+        try:
+            if ordered and mode == 'grid':
+                # Grid order: wait for each point in turn
+                for position, task in enumerate(tasks):
+                    result = await task
+                    if isinstance(result[4], api_usage.BudgetExceeded):
+                        exhausted = result[4]
+                        remaining = tasks[position + 1:]
+                        break
+                    searched += 1
+                    yield event(*result)
+            else:
+                # Completion order; in adaptive mode saturated cells enqueue their quadrants
+                pending = set(tasks)
+                while pending and exhausted is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        idx, cell, results, saturated, error = task.result()
+                        if isinstance(error, api_usage.BudgetExceeded):
+                            exhausted = error
+                            continue
+                        if mode == 'adaptive' and saturated and exhausted is None and cell.radius / 2 >= ADAPTIVE_MIN_RADIUS_M:
+                            children = split_cell(cell, center_coords, radius)
+                            # A cell is split into all its quadrants or none, within the cap
+                            if total + len(children) > ADAPTIVE_MAX_CELLS:
+                                children = []
+                            for child in children:
+                                child_task = asyncio.create_task(search_cell(total, child, semaphore, bucket))
+                                tasks.append(child_task)
+                                pending.add(child_task)
+                                total += 1
+                        # Points finished alongside the refused one were paid for: still sent
+                        searched += 1
+                        yield event(idx, cell, results, saturated, error)
+                remaining = sorted(pending, key=tasks.index)
+            if exhausted is not None:
+                dropped = [task for task in remaining if not task.done() and task not in sent]
+                for task in dropped:
+                    task.cancel()
+                for task in remaining:
+                    if task in dropped:
+                        continue
+                    result = await task
+                    if not isinstance(result[4], api_usage.BudgetExceeded):
+                        searched += 1
+                        yield event(*result)
+                yield budget_event(exhausted, searched)
+        finally:
+            # Client went away or we're done: don't leave searches running
+            for task in tasks:
+                task.cancel()
     return StreamingResponse(stream(), media_type="text/event-stream") 
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Prometheus metrics, served in text format by /metrics.
+
+- http_request_duration_seconds{method,route,status}: request latency per route
+  template (streamed responses are reported in http_stream_duration_seconds{route})
+- google_requests_total{endpoint,outcome} / google_request_duration_seconds{endpoint}:
+  upstream calls per Google endpoint (geocode, reverse_geocode, nearby,
+  details), including retries; google_retries_total{endpoint} counts the retries
+- google_api_calls_total{sku,source} / google_api_budget_rejections_total{source,scope}:
+  metered calls per billing SKU and originating job, and calls refused by a
+  job or daily budget (see api_usage.py)
+- cache_lookups_total{cache,result}: hit, miss or expired per cache
+- db_query_duration_seconds{operation}: statement execution time by SQL verb,
+  and db_pool_wait_seconds for connection checkouts
+- db_pool_connections{state}: pool occupancy (checked_out, checked_in,
+  overflow, pool_size) after the last checkout or checkin; summed over
+  live workers in multiprocess mode
+- search_history_rows_total{result}: rows written, written_inline, dropped or failed by the history writer
+
+Settings (environment):
+- PROMETHEUS_MULTIPROC_DIR: with more than one worker process (uvicorn
+  --workers, gunicorn), a directory every worker can write to, emptied before
+  the server starts. Each worker writes its samples there and /metrics adds up
+  all workers, whichever one serves the scrape. Without it, /metrics only
+  reports the worker that answers.
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Responses with these content types are streams: their duration is how long the client stayed connected
+STREAM_CONTENT_TYPES = (b'text/event-stream', b'application/x-ndjson')
+UNMATCHED_ROUTE = '<unmatched>'
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+STREAM_DURATION = Histogram(
+    'http_stream_duration_seconds', 'Duration of streamed (SSE / NDJSON) responses by route template',
+    ['route'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+UPSTREAM_REQUESTS = Counter(
+    'google_requests_total', 'Google API calls by endpoint and outcome (ok, http_error, error, refused by a budget)',
+    ['endpoint', 'outcome']
+)
+UPSTREAM_RETRIES = Counter('google_retries_total', 'Google API call retries by endpoint', ['endpoint'])
+UPSTREAM_LATENCY = Histogram(
+    'google_request_duration_seconds', 'Google API call latency by endpoint, including retries',
+    ['endpoint'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+API_CALLS = Counter('google_api_calls_total', 'Metered Google API calls by SKU and originating job', ['sku', 'source'])
+API_BUDGET_REJECTIONS = Counter(
+    'google_api_budget_rejections_total', 'Google API calls refused by a budget, by job and scope (job, daily)',
+    ['source', 'scope']
+)
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Cache lookups by cache and result (hit, miss, expired)', ['cache', 'result'])
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Database statement execution time by SQL verb',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Database pool connections by state (checked_out, checked_in, overflow, pool_size)',
+    ['state'], multiprocess_mode='livesum'
+)
+HISTORY_ROWS = Counter('search_history_rows_total', 'Search history rows by result (written, written_inline, dropped, failed)', ['result'])
+
+# Statement verbs reported as-is; anything else is 'other'
+DB_OPERATIONS = {'select', 'insert', 'update', 'delete', 'with', 'begin', 'commit', 'rollback', 'savepoint', 'release', 'set', 'reset'}
+
+def count_cache(cache, result, n=1):
+    if n:
+        CACHE_LOOKUPS.labels(cache, result).inc(n)
+
+def set_pool_occupancy(pool):
+    """Update db_pool_connections from a QueuePool."""
+    DB_POOL_CONNECTIONS.labels('checked_out').set(pool.checkedout())
+    DB_POOL_CONNECTIONS.labels('checked_in').set(pool.checkedin())
+    # QueuePool counts overflow from -pool_size; only connections beyond the pool are overflow
+    DB_POOL_CONNECTIONS.labels('overflow').set(max(0, pool.overflow()))
+    DB_POOL_CONNECTIONS.labels('pool_size').set(pool.size())
+
+def db_operation(statement):
+    """Label for a SQL statement: its lowercased first word, if a known one."""
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+    return verb if verb in DB_OPERATIONS else 'other'
+
+def render():
+    """(body, content type) of the current metrics, summed over all workers in multiprocess mode."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request under its route template (e.g. /stores/nearby)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        response = {'status': 500, 'stream': False}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                content_type = dict(message.get('headers', ())).get(b'content-type', b'')
+                response['stream'] = content_type.startswith(STREAM_CONTENT_TYPES)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            # The router puts the matched route in the scope; unmatched paths share one label
+            route = scope.get('route')
+            path = getattr(route, 'path', UNMATCHED_ROUTE)
+            if response['stream']:
+                STREAM_DURATION.labels(path).observe(elapsed)
+            else:
+                REQUEST_LATENCY.labels(scope['method'], path, str(response['status'])).observe(elapsed)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, DECIMAL, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, Date, DateTime, Text, DECIMAL, ForeignKey, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -9,20 +9,32 @@ class SearchHistory(Base):
     __tablename__ = 'search_history'
     
     id = Column(Integer, primary_key=True)
-    location = Column(String(255), nullable=False)
-    search_timestamp = Column(DateTime, default=datetime.utcnow)
+    location = Column(String(255), nullable=False, index=True)
+    search_timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     user_ip = Column(String(45))
-    search_status = Column(String(50))
+    search_status = Column(String(50), index=True)
     store_count = Column(Integer)
     response_time_ms = Column(Integer)
+    # Where response_time_ms went (see timing.py); NULL for phases the search skipped
+    cache_ms = Column(Integer)
+    geocode_ms = Column(Integer)
+    nearby_ms = Column(Integer)
+    pagetoken_wait_ms = Column(Integer)
+    details_ms = Column(Integer)
+    save_ms = Column(Integer)
+    # Google API requests made for the search, retries included
+    upstream_calls = Column(Integer)
     
     stores = relationship("Store", back_populates="search")
+    # Every store a search returned, including ones first found by earlier searches
+    found_stores = relationship("Store", secondary="search_stores", viewonly=True)
 
 class Store(Base):
     __tablename__ = 'stores'
     
     id = Column(Integer, primary_key=True)
-    search_id = Column(Integer, ForeignKey('search_history.id'))
+    # The search that first found the store; see search_stores for all of them
+    search_id = Column(Integer, ForeignKey('search_history.id'), index=True)
     name = Column(String(255), nullable=False)
     address = Column(Text)
     website = Column(String(500))
@@ -30,9 +42,21 @@ class Store(Base):
     place_id = Column(String(255), unique=True)
     latitude = Column(DECIMAL(10, 8))
     longitude = Column(DECIMAL(11, 8))
+    # Geohash of latitude/longitude, for prefix lookups of nearby stores (see spatial.py)
+    geohash = Column(String(12))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     search = relationship("SearchHistory", back_populates="stores")
+    
+    __table_args__ = (
+        Index('ix_stores_geohash', 'geohash', postgresql_ops={'geohash': 'varchar_pattern_ops'}),
+    )
+
+class SearchStore(Base):
+    __tablename__ = 'search_stores'
+    
+    search_id = Column(Integer, ForeignKey('search_history.id'), primary_key=True)
+    store_id = Column(Integer, ForeignKey('stores.id'), primary_key=True, index=True)
 
 class LocationCache(Base):
     __tablename__ = 'location_cache'
@@ -40,5 +64,72 @@ class LocationCache(Base):
     location_hash = Column(String(64), primary_key=True)
     location = Column(String(255), nullable=False)
     results = Column(JSON)
+    # len(results['stores']), so listings don't have to load results
+    store_count = Column(Integer)
+    cached_at = Column(DateTime, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, index=True)
+
+class NearbyCache(Base):
+    __tablename__ = 'nearby_cache'
+    
+    # Geohash cell of the query center (see nearby_cache.query_point), radius in meters and place type
+    cell = Column(String(12), primary_key=True)
+    radius = Column(Integer, primary_key=True)
+    place_type = Column(String(50), primary_key=True)
+    results = Column(JSON)
+    # False when only the first page was fetched and more results exist
+    exhaustive = Column(Boolean, nullable=False, default=False)
+    cached_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+class PlaceDetailsCache(Base):
+    __tablename__ = 'place_details_cache'
+    
+    place_id = Column(String(255), primary_key=True)
+    # Normalized field mask (see details_cache.fields_key)
+    fields = Column(String(255), primary_key=True)
+    result = Column(JSON)
     cached_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime)
\ No newline at end of file
+    expires_at = Column(DateTime, index=True)
+
+class GeocodeCache(Base):
+    __tablename__ = 'geocode_cache'
+    
+    # 'address:<normalized query>' or 'latlng:<rounded lat>,<rounded lng>'
+    cache_key = Column(String(512), primary_key=True)
+    query = Column(String(255))
+    latitude = Column(DECIMAL(10, 8))
+    longitude = Column(DECIMAL(11, 8))
+    formatted_address = Column(Text)
+    result = Column(JSON)
+    cached_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime)
+
+class SearchStatsHourly(Base):
+    """Searches per hour and final status, kept up to date as searches finish."""
+    __tablename__ = 'search_stats_hourly'
+    
+    bucket = Column(DateTime, primary_key=True)
+    search_status = Column(String(50), primary_key=True)
+    search_count = Column(BigInteger, nullable=False, default=0)
+    stores_returned = Column(BigInteger, nullable=False, default=0)
+    # Stores first saved in this hour (recorded under 'success')
+    new_stores = Column(BigInteger, nullable=False, default=0)
+
+class LocationSearchCount(Base):
+    """Searches per location, kept up to date as searches finish."""
+    __tablename__ = 'location_search_counts'
+    
+    location = Column(String(255), primary_key=True)
+    search_count = Column(BigInteger, nullable=False, default=0, index=True)
+    last_searched_at = Column(DateTime)
+
+class ApiUsage(Base):
+    """Google API calls per UTC day, billing SKU and originating job, added to by every process (see api_usage.py)."""
+    __tablename__ = 'api_usage'
+    
+    day = Column(Date, primary_key=True)
+    sku = Column(String(50), primary_key=True)
+    # 'search', 'bulk', 'refresh', 'backend' or 'crawl:<script>'
+    source = Column(String(100), primary_key=True)
+    calls = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,126 @@
+"""
+Persistent cache of Nearby Search results keyed by coordinates (nearby_cache table).
+
+location_cache only helps when a query string repeats; this cache is keyed by
+the geohash cell of the query center plus radius and place type, so
+differently worded queries such as "Shibuya, Tokyo" and "Shibuya Station", or
+/bulk_search grid points, share an entry when their centers fall in the same cell. Cells are the largest whose diagonal is at most
+NEARBY_CACHE_TOLERANCE of the radius, and every query is sent for the center
+of its cell with the radius widened by half the cell diagonal, so a cached
+answer always covers the circle that was asked for.
+
+An entry is exhaustive when it holds every page Google returned; /bulk_search
+only fetches the first page and stores it as non-exhaustive, which /search
+doesn't reuse.
+
+Settings (environment):
+- NEARBY_CACHE_TTL_HOURS: how long Nearby Search results are reused (default 168)
+- NEARBY_CACHE_TOLERANCE: max cell diagonal as a fraction of the radius (default 0.15)
+
+All functions are blocking; call them through run_in_threadpool from async code.
+"""
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import metrics
+from grid import MAX_NEARBY_RADIUS_M
+from models import NearbyCache
+from spatial import GEOHASH_PRECISION, decode, encode
+from upserts import dialect_insert
+
+NEARBY_CACHE_TTL_HOURS = float(os.getenv('NEARBY_CACHE_TTL_HOURS', '168'))
+NEARBY_CACHE_TOLERANCE = float(os.getenv('NEARBY_CACHE_TOLERANCE', '0.15'))
+# Results per Nearby Search page
+PAGE_SIZE = 20
+# Result fields the search endpoints use; the rest isn't stored
+RESULT_FIELDS = ('place_id', 'name', 'vicinity', 'geometry')
+METERS_PER_DEGREE = 111320
+
+# Per-process hit/miss counters, reported by /analytics/nearby-cache
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+class QueryPoint(NamedTuple):
+    cell: str
+    radius: int
+    # Where to send the Nearby Search request, and with what radius
+    lat: float
+    lng: float
+    query_radius: int
+
+def query_point(lat, lng, radius):
+    """Cache cell for a query, and the snapped center / widened radius to query Google with."""
+    radius = round(radius)
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cell = encode(lat, lng, precision)
+        south, west, north, east = decode(cell)
+        height = (north - south) * METERS_PER_DEGREE
+        width = (east - west) * METERS_PER_DEGREE * math.cos(math.radians((south + north) / 2))
+        diagonal = math.hypot(height, width)
+        if diagonal <= radius * NEARBY_CACHE_TOLERANCE:
+            break
+    query_radius = min(MAX_NEARBY_RADIUS_M, math.ceil(radius + diagonal / 2))
+    return QueryPoint(cell, radius, (south + north) / 2, (west + east) / 2, query_radius)
+
+def _count(result):
+    with _stats_lock:
+        _stats['hits' if result == 'hit' else 'misses'] += 1
+    metrics.count_cache('nearby', result)
+
+def get(db, point, place_type, exhaustive=False, max_age=None):
+    """
+    Cached (results, exhaustive) for a query point, or None. With `exhaustive`,
+    first-page-only entries don't count; with `max_age` (a timedelta), entries
+    cached longer ago than that count as expired.
+    """
+    entry = db.query(NearbyCache).filter(
+        NearbyCache.cell == point.cell,
+        NearbyCache.radius == point.radius,
+        NearbyCache.place_type == place_type
+    ).first()
+    # End the read transaction so the connection isn't held during upstream calls
+    db.commit()
+    if entry is None or (exhaustive and not entry.exhaustive):
+        result = 'miss'
+    else:
+        now = datetime.utcnow()
+        fresh = entry.expires_at > now and (max_age is None or entry.cached_at > now - max_age)
+        result = 'hit' if fresh else 'expired'
+    _count(result)
+    return (entry.results, entry.exhaustive) if result == 'hit' else None
+
+def save(db, point, place_type, results, exhaustive):
+    """Cache Nearby Search results; a first-page-only entry never replaces a live exhaustive one."""
+    now = datetime.utcnow()
+    insert = dialect_insert(db, NearbyCache)
+    stmt = insert.values(
+        cell=point.cell,
+        radius=point.radius,
+        place_type=place_type,
+        results=[{field: result[field] for field in RESULT_FIELDS if field in result} for result in results],
+        exhaustive=exhaustive,
+        cached_at=now,
+        expires_at=now + timedelta(hours=NEARBY_CACHE_TTL_HOURS)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['cell', 'radius', 'place_type'],
+        set_={column: insert.excluded[column] for column in ('results', 'exhaustive', 'cached_at', 'expires_at')},
+        where=insert.excluded.exhaustive | ~NearbyCache.exhaustive | (NearbyCache.expires_at <= now)
+    )
+    db.execute(stmt)
+    db.commit()
+
+def first_page(results, exhaustive):
+    """A cached entry as one Nearby Search page: (results, whether more pages exist)."""
+    return results[:PAGE_SIZE], not exhaustive or len(results) > PAGE_SIZE
+
+def cache_stats():
+    """Hit/miss counts and hit rate (%) since this process started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups * 100, 2) if lookups else 0
+    return stats
@@ -0,0 +1,59 @@
+"""
+Pre-encoded JSON bodies for cached search results.
+
+A cached /search result is encoded once (orjson when installed) and kept as
+bytes together with its ETag, so serving it again skips pydantic validation
+and re-serialization, and clients sending a matching If-None-Match get a 304.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    # Same ISO 8601 form orjson and FastAPI use for datetimes
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes, the same output as FastAPI's JSONResponse."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+class EncodedSearch(NamedTuple):
+    body: bytes
+    etag: str
+    store_count: int
+    # When the results were fetched from Google (location_cache.cached_at)
+    cached_at: Optional[datetime] = None
+
+def encode_search(results, cached_at=None):
+    """Encode a {'location', 'stores'} dict as stored in location_cache.results."""
+    body = dumps(results)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return EncodedSearch(body, etag, len(results.get('stores', [])), cached_at)
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+def search_response(encoded, request=None):
+    """200 with the pre-encoded body, or 304 when the client already has it."""
+    headers = {'ETag': encoded.etag}
+    if request is not None and etag_matches(request.headers.get('if-none-match'), encoded.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=encoded.body, media_type='application/json', headers=headers)
@@ -0,0 +1,128 @@
+"""
+Incrementally maintained analytics rollups.
+
+Every finished search adds one to its hour/status bucket in search_stats_hourly
+and to its location's row in location_search_counts, in the same transaction
+that writes its search_history row (one aggregated upsert per batch, see
+history_writer.py); newly saved stores are added to their hour's bucket. The analytics endpoints read these small tables instead of scanning
+search_history and stores, so their cost depends on the number of hours and
+locations rather than on the number of searches.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import LocationSearchCount, SearchStatsHourly
+from upserts import dialect_insert
+
+# Searches still 'processing' never finished; record_searches only counts final statuses
+FINISHED_SQL = "(search_status IS NULL OR search_status <> 'processing')"
+
+def hour_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def hour_sql(dialect, column):
+    """SQL truncating `column` to its hour_bucket on `dialect` ('postgresql' or 'sqlite')."""
+    if dialect == 'postgresql':
+        return f"date_trunc('hour', {column})"
+    # Same text format SQLAlchemy stores SQLite DateTimes in, so the app's upserts hit these rows
+    return f"strftime('%Y-%m-%d %H:00:00.000000', {column})"
+
+def backfill_statements(dialect):
+    """
+    SQL filling the (empty) rollup tables from search_history and stores, as
+    record_searches and record_new_stores would have; used by migration 0004.
+    """
+    return [
+        f"""
+        INSERT INTO search_stats_hourly (bucket, search_status, search_count, stores_returned, new_stores)
+        SELECT {hour_sql(dialect, 'search_timestamp')}, COALESCE(search_status, 'unknown'), COUNT(*), COALESCE(SUM(store_count), 0), 0
+        FROM search_history
+        WHERE search_timestamp IS NOT NULL AND {FINISHED_SQL}
+        GROUP BY 1, 2
+        """,
+        # (SQLite needs the WHERE to parse ON CONFLICT after INSERT ... SELECT)
+        f"""
+        INSERT INTO search_stats_hourly (bucket, search_status, search_count, stores_returned, new_stores)
+        SELECT {hour_sql(dialect, 'created_at')}, 'success', 0, 0, COUNT(*)
+        FROM stores
+        WHERE created_at IS NOT NULL
+        GROUP BY 1
+        ON CONFLICT (bucket, search_status) DO UPDATE SET new_stores = excluded.new_stores
+        """,
+        f"""
+        INSERT INTO location_search_counts (location, search_count, last_searched_at)
+        SELECT location, COUNT(*), MAX(search_timestamp)
+        FROM search_history
+        WHERE {FINISHED_SQL}
+        GROUP BY location
+        """,
+    ]
+
+def _increment(db, model, keys, counts, rows, updates=()):
+    """
+    Add each row's `counts` columns to the row identified by its `keys` columns,
+    creating it if missing; `updates` columns are overwritten. Rows are sorted
+    by key so concurrent writers lock them in the same order.
+    """
+    if not rows:
+        return
+    insert = dialect_insert(db, model)
+    set_ = {column: getattr(model, column) + insert.excluded[column] for column in counts}
+    set_.update({column: insert.excluded[column] for column in updates})
+    stmt = insert.on_conflict_do_update(index_elements=list(keys), set_=set_)
+    db.execute(stmt, sorted(rows, key=lambda row: tuple(row[key] for key in keys)))
+
+def record_searches(db, searches):
+    """
+    Count searches that reached their final status: dicts with search_timestamp,
+    search_status, store_count and location. Call once per search; does not commit.
+    """
+    hourly = {}
+    locations = {}
+    for search in searches:
+        searched_at = search.get('search_timestamp') or datetime.utcnow()
+        key = (hour_bucket(searched_at), search.get('search_status') or 'unknown')
+        row = hourly.setdefault(key, {'bucket': key[0], 'search_status': key[1], 'search_count': 0, 'stores_returned': 0})
+        row['search_count'] += 1
+        row['stores_returned'] += search.get('store_count') or 0
+        row = locations.setdefault(search['location'], {'location': search['location'], 'search_count': 0, 'last_searched_at': searched_at})
+        row['search_count'] += 1
+        row['last_searched_at'] = max(row['last_searched_at'], searched_at)
+    _increment(db, SearchStatsHourly, ('bucket', 'search_status'), ('search_count', 'stores_returned'), list(hourly.values()))
+    _increment(db, LocationSearchCount, ('location',), ('search_count',), list(locations.values()), updates=('last_searched_at',))
+
+def record_new_stores(db, count, saved_at=None):
+    """Count stores saved for the first time. Does not commit."""
+    if count:
+        _increment(
+            db, SearchStatsHourly, ('bucket', 'search_status'), ('new_stores',),
+            [{'bucket': hour_bucket(saved_at or datetime.utcnow()), 'search_status': 'success', 'new_stores': count}]
+        )
+
+def search_stats_query(as_of=None):
+    """(status, searches, new stores) per final status, up to the end of the hour containing `as_of`."""
+    query = select(
+        SearchStatsHourly.search_status,
+        func.sum(SearchStatsHourly.search_count),
+        func.sum(SearchStatsHourly.new_stores)
+    )
+    if as_of is not None:
+        query = query.where(SearchStatsHourly.bucket < hour_bucket(as_of) + timedelta(hours=1))
+    return query.group_by(SearchStatsHourly.search_status)
+
+def search_stats(db, as_of=None):
+    """
+    Searches per final status and total new stores, as of the end of the hour
+    containing `as_of` (everything recorded so far when None).
+    """
+    rows = db.execute(search_stats_query(as_of)).all()
+    searches = {status: int(count or 0) for status, count, _ in rows}
+    new_stores = sum(int(stores or 0) for _, _, stores in rows)
+    return searches, new_stores
+
+def popular_locations_query(limit=10):
+    return select(LocationSearchCount).order_by(LocationSearchCount.search_count.desc()).limit(limit)
+
+def popular_locations(db, limit=10):
+    return db.scalars(popular_locations_query(limit)).all()
@@ -0,0 +1,156 @@
+"""
+Nearby lookups over the stores table, without calling Google.
+
+Each store carries the geohash of its coordinates (stores.geohash, GEOHASH_PRECISION
+characters, ~5 m cells). A geohash is a prefix code: every point inside a cell
+has a geohash starting with the cell's, so "stores in these cells" is a set of
+prefix ranges on a plain B-tree index. A radius or bounding-box query is
+covered with at most MAX_COVER_CELLS cells of the finest precision that fits,
+the index narrows the candidates to those cells, and exact distances are
+computed here.
+
+All database functions are blocking; call them through run_in_threadpool from async code.
+"""
+import math
+
+import numpy as np
+from sqlalchemy import and_, or_, select
+
+from grid import EARTH_RADIUS_M, haversine_np
+from models import Store
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# More cells mean tighter candidate sets but more index range scans per query
+MAX_COVER_CELLS = 16
+
+# Radius queries start at this radius and grow by NEARBY_GROWTH until they have enough stores
+NEARBY_START_RADIUS_M = 250
+NEARBY_GROWTH = 4
+
+NEARBY_COLUMNS = (Store.name, Store.address, Store.website, Store.phone, Store.place_id, Store.latitude, Store.longitude)
+
+def cell_size(precision):
+    """Height and width in degrees of a geohash cell with `precision` characters."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Geohash of a point; None when either coordinate is missing."""
+    if lat is None or lng is None:
+        return None
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bit = value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude (even) and latitude (odd)
+        rng, coord = (lng_range, float(lng)) if even else (lat_range, float(lat))
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value = value * 2
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = value = 0
+    return ''.join(chars)
+
+def decode(geohash):
+    """(south, west, north, east) bounds of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+def bbox_around(lat, lng, radius_m):
+    """(south, west, north, east) box containing the circle; west > east when it crosses the antimeridian."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    if dlng >= 180:
+        return south, -180.0, north, 180.0
+    west, east = lng - dlng, lng + dlng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+def cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """Geohash prefixes whose cells together contain the box, using the finest precision that needs at most `max_cells`."""
+    width = east - west if west <= east else east - west + 360
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, cell_width = cell_size(precision)
+        rows = range(int((south + 90) // height), int((min(north, 90 - 1e-12) + 90) // height) + 1)
+        first_col = int((west + 180) // cell_width)
+        columns_total = int(round(360 / cell_width))
+        last_col = int((west + width - 1e-12 + 180) // cell_width)
+        columns = [col % columns_total for col in range(first_col, last_col + 1)]
+        if len(rows) * len(set(columns)) <= max_cells or precision == 1:
+            return sorted({
+                encode(-90 + (row + 0.5) * height, -180 + (col + 0.5) * cell_width, precision)
+                for row in rows for col in columns
+            })
+
+def prefix_filter(column, prefixes, dialect):
+    """Rows whose `column` starts with any of `prefixes`, in a form the dialect's index can serve."""
+    if dialect == 'postgresql':
+        # Served by the varchar_pattern_ops index, whatever the database collation
+        return or_(*(column.like(prefix + '%') for prefix in prefixes))
+    # SQLite compares text bytewise, so a prefix is the range [prefix, prefix + highest char)
+    return or_(*(and_(column >= prefix, column < prefix + '~') for prefix in prefixes))
+
+def _candidates_in(db, bbox):
+    south, west, north, east = bbox
+    lng_filter = (Store.longitude.between(west, east) if west <= east
+                  else or_(Store.longitude >= west, Store.longitude <= east))
+    query = select(*NEARBY_COLUMNS).where(
+        prefix_filter(Store.geohash, cover(*bbox), db.get_bind().dialect.name),
+        Store.latitude.between(south, north),
+        lng_filter,
+    )
+    return db.execute(query).all()
+
+def _closest(candidates, lat, lng, radius_m, limit):
+    if not candidates:
+        return []
+    lats = np.array([float(store.latitude) for store in candidates])
+    lngs = np.array([float(store.longitude) for store in candidates])
+    distances = haversine_np(lat, lng, lats, lngs)
+    order = np.argsort(distances, kind='stable')
+    if radius_m is not None:
+        order = order[distances[order] <= radius_m]
+    return [(candidates[i], float(distances[i])) for i in order[:limit]]
+
+def stores_near(db, lat, lng, radius_m=None, bbox=None, limit=50):
+    """
+    Stored stores within `radius_m` meters of lat/lng, or inside `bbox`
+    (south, west, north, east), closest to lat/lng first. Returns
+    (row of NEARBY_COLUMNS, distance in meters) pairs, at most `limit` of them.
+    """
+    if bbox is not None:
+        return _closest(_candidates_in(db, bbox), lat, lng, None, limit)
+    # Nearest first: once a circle holds `limit` stores nothing outside it can
+    # be closer, so dense areas never read the whole radius
+    searched = min(radius_m, NEARBY_START_RADIUS_M)
+    while True:
+        found = _closest(_candidates_in(db, bbox_around(lat, lng, searched)), lat, lng, searched, limit)
+        if len(found) >= limit or searched >= radius_m:
+            return found
+        searched = min(radius_m, searched * NEARBY_GROWTH)
@@ -0,0 +1,15 @@
+"""
+Test setup: the backend modules on the import path and a scratch SQLite
+database, set before any of them reads DATABASE_URL. Run from backend/:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/test.db')
+# The app must never reach the real Google APIs from tests
+os.environ.setdefault('GOOGLE_MAPS_BASE_URL', 'http://127.0.0.1:9')
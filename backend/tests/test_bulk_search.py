@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+
+import main
+from grid import MAX_NEARBY_RADIUS_M, root_cells
+
+client = TestClient(main.app)
+
+def test_root_cells_for_large_radius_exceed_the_cap():
+    # Each root cell is at most the Nearby Search radius limit, so a large area can't start from fewer
+    cells = root_cells((35.0, 139.0), 1_000_000)
+    assert len(cells) > main.ADAPTIVE_MAX_CELLS
+    assert all(cell.radius <= MAX_NEARBY_RADIUS_M for cell in cells)
+
+def test_adaptive_rejects_radius_needing_more_than_max_cells():
+    response = client.get('/bulk_search', params={'center': '35.0,139.0', 'radius': 1_000_000, 'mode': 'adaptive'})
+    assert response.status_code == 400
+    assert 'ADAPTIVE_MAX_CELLS' in response.json()['detail']
+
+def test_root_cell_limit_follows_the_setting(monkeypatch):
+    # 300 km needs 226 root cells: allowed by the default cap of 400, refused by a cap of 200
+    assert len(root_cells((35.0, 139.0), 300_000)) <= main.ADAPTIVE_MAX_CELLS
+    monkeypatch.setattr(main, 'ADAPTIVE_MAX_CELLS', 200)
+    response = client.get('/bulk_search', params={'center': '35.0,139.0', 'radius': 300_000, 'mode': 'adaptive'})
+    assert response.status_code == 400
@@ -0,0 +1,26 @@
+from sqlalchemy import text
+
+import metrics
+from database import SessionLocal, engine
+
+def pool_gauges():
+    return {state: metrics.DB_POOL_CONNECTIONS.labels(state)._value.get()
+            for state in ('checked_out', 'checked_in', 'overflow', 'pool_size')}
+
+def test_pool_occupancy_gauges_follow_checkouts():
+    before = pool_gauges()
+    db = SessionLocal()
+    try:
+        db.execute(text('SELECT 1'))
+        assert pool_gauges()['checked_out'] == before['checked_out'] + 1
+    finally:
+        db.close()
+    after = pool_gauges()
+    assert after['checked_out'] == before['checked_out']
+    assert after['checked_in'] == engine.pool.checkedin()
+    assert after['pool_size'] == engine.pool.size()
+
+def test_pool_occupancy_is_exported():
+    body, _ = metrics.render()
+    for state in ('checked_out', 'checked_in', 'overflow', 'pool_size'):
+        assert f'db_pool_connections{{state="{state}"}}' in body.decode()
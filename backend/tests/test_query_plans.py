@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks import explain_analytics
+from database import run_migrations
+
+# Enough rows for ANALYZE to make a table scan the costlier plan
+ROWS = 20000
+
+@pytest.fixture(scope='module')
+def loaded_database():
+    run_migrations()
+    explain_analytics.load(ROWS)
+
+@pytest.mark.parametrize('label, stmt, indexes', explain_analytics.CHECKS,
+                         ids=[check[0] for check in explain_analytics.CHECKS])
+def test_analytics_query_uses_its_index(loaded_database, label, stmt, indexes):
+    plan = explain_analytics.explain(stmt)
+    assert any(index in plan for index in indexes), f'{label} is not planned on {" or ".join(indexes)}:\n{plan}'
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main
+from database import run_migrations
+from responses import encode_search
+
+STORE = main.Store(name='Corner Hardware', address='1 Main St', place_id='p1')
+
+@pytest.fixture(autouse=True)
+def fake_fetch(monkeypatch):
+    """fetch_search_once that sends one page of stores, then waits for `release` before answering."""
+    run_migrations()
+    state = {'calls': 0, 'release': None}
+
+    async def fetch_search_once(location, location_hash, history=None, wait=True, max_cache_age=None, on_event=None):
+        state['calls'] += 1
+        if on_event is not None:
+            on_event(('stores', 0, [STORE]))
+        await state['release'].wait()
+        return encode_search({'location': location, 'stores': [STORE.dict()]})
+
+    monkeypatch.setattr(main, 'fetch_search_once', fetch_search_once)
+    return state
+
+def run(monkeypatch, fake_fetch, *paths):
+    """Request `paths` in order, releasing the fetch once each has started or joined it."""
+    started = []
+    start = main.search_flights.start
+    monkeypatch.setattr(main.search_flights, 'start', lambda key, fn: started.append(key) or start(key, fn))
+
+    async def requests():
+        fake_fetch['release'] = asyncio.Event()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            responses = []
+            for count, path in enumerate(paths, 1):
+                responses.append(asyncio.create_task(client.get(path)))
+                while len(started) < count:
+                    await asyncio.sleep(0.01)
+            fake_fetch['release'].set()
+            return await asyncio.gather(*responses)
+    return asyncio.run(requests())
+
+def stream_events(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_stream_joins_a_search_in_flight(monkeypatch, fake_fetch):
+    search, stream = run(monkeypatch, fake_fetch, '/search?location=flight-a', '/search/stream?location=flight-a')
+    assert fake_fetch['calls'] == 1
+    assert search.json()['stores'][0]['name'] == 'Corner Hardware'
+    # Joined fetches send no progress, only the result
+    assert [event['event'] for event in stream_events(stream)] == ['done']
+    assert stream_events(stream)[0]['result'] == search.json()
+
+def test_search_joins_a_stream_in_flight(monkeypatch, fake_fetch):
+    stream, search = run(monkeypatch, fake_fetch, '/search/stream?location=flight-b', '/search?location=flight-b')
+    assert fake_fetch['calls'] == 1
+    events = stream_events(stream)
+    assert [event['event'] for event in events] == ['stores', 'done']
+    assert events[-1]['result'] == search.json()
@@ -0,0 +1,80 @@
+"""
+Per-search phase timings, reported in the Server-Timing header of /search and
+saved with each search_history row.
+
+The handler puts a SearchTiming in the `current` context variable; code on the
+search path records into it with phase() / add() / count_upstream_call() and
+does nothing when no search is being timed (bulk search, background refreshes).
+Tasks started by the search inherit it, so concurrent lookups are counted too.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phase name -> search_history column, in the order phases happen
+PHASE_COLUMNS = {
+    'cache': 'cache_ms',
+    'geocode': 'geocode_ms',
+    'nearby': 'nearby_ms',
+    'pagetoken': 'pagetoken_wait_ms',
+    'details': 'details_ms',
+    'save': 'save_ms',
+}
+PHASE_DESCRIPTIONS = {
+    'cache': 'Search cache lookup',
+    'geocode': 'Geocoding',
+    'nearby': 'Nearby Search pages',
+    'pagetoken': 'Waiting for next_page_token (part of nearby)',
+    'details': 'Place Details after the last page',
+    'save': 'Saving stores and results',
+}
+
+current = ContextVar('search_timing', default=None)
+
+class SearchTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.upstream_calls = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header(self):
+        """Server-Timing header value (durations in ms)."""
+        metrics = [
+            f'{phase};dur={self.phases[phase] * 1000:.1f};desc="{PHASE_DESCRIPTIONS[phase]}"'
+            for phase in PHASE_COLUMNS if phase in self.phases
+        ]
+        metrics.append(f'upstream;desc="{self.upstream_calls} Google API calls"')
+        metrics.append(f'total;dur={self.total() * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def history_columns(self):
+        """search_history timing columns; phases that didn't run are left NULL."""
+        columns = {column: round(self.phases[phase] * 1000) if phase in self.phases else None
+                   for phase, column in PHASE_COLUMNS.items()}
+        columns['upstream_calls'] = self.upstream_calls
+        return columns
+
+def add(phase, seconds):
+    timing = current.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as (part of) phase `name` of the current search."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - start)
+
+def count_upstream_call():
+    timing = current.get()
+    if timing is not None:
+        timing.upstream_calls += 1
@@ -0,0 +1,78 @@
+"""
+Bulk writes of stores found by a search.
+
+upsert_stores() writes all stores of a search with a single batched
+INSERT ... ON CONFLICT (place_id) DO UPDATE (PostgreSQL and SQLite), so a
+store found again by a later search updates its row instead of failing the
+unique constraint, and links every store to the search in search_stores.
+Stores saved before their search_history row exists (see history_writer.py)
+are written without a search and linked later with link_stores().
+"""
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import SearchStore, Store
+from spatial import encode
+
+UPDATED_COLUMNS = ('name', 'address', 'website', 'phone', 'latitude', 'longitude', 'geohash')
+
+def dialect_insert(db, table):
+    """INSERT construct with ON CONFLICT support for the session's database."""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f"No upsert support for the {dialect} dialect")
+
+def upsert_stores(db, search_id, stores):
+    """
+    Insert or update `stores` (dicts with Store column values, keyed by
+    place_id) and link them to `search_id`, if given. Returns the distinct store ids and
+    how many of them were new rows. Does not commit.
+    """
+    # ON CONFLICT DO UPDATE can't touch the same row twice in one statement;
+    # rows without a place_id can't conflict and are always inserted
+    unique = {}
+    for store in stores:
+        unique[store.get('place_id') or object()] = store
+    # An explicit created_at tells inserted rows (which get it) from updated ones (which keep theirs)
+    now = datetime.utcnow()
+    rows = [
+        dict(store, search_id=search_id, created_at=now, geohash=encode(store.get('latitude'), store.get('longitude')))
+        for store in unique.values()
+    ]
+
+    insert = dialect_insert(db, Store)
+    # search_id is left alone on conflict: it keeps the first search that found the store
+    stmt = insert.on_conflict_do_update(
+        index_elements=['place_id'],
+        set_={column: insert.excluded[column] for column in UPDATED_COLUMNS}
+    ).returning(Store.id, Store.created_at)
+    # executemany with RETURNING: SQLAlchemy batches the rows into multi-row
+    # INSERT ... VALUES statements ("insertmanyvalues") and caches the compiled form
+    returned = db.execute(stmt, rows).all() if rows else []
+    store_ids = list(dict.fromkeys(store_id for store_id, _ in returned))
+    inserted = sum(1 for _, created_at in returned if created_at == now)
+
+    if search_id is not None:
+        link_stores(db, search_id, store_ids)
+    return store_ids, inserted
+
+def link_stores(db, search_id, store_ids):
+    """
+    Record that `search_id` returned `store_ids` in search_stores, and make it
+    the first search of stores saved without one. Does not commit.
+    """
+    if not store_ids:
+        return
+    links = [{'search_id': search_id, 'store_id': store_id} for store_id in store_ids]
+    db.execute(dialect_insert(db, SearchStore).on_conflict_do_nothing(), links)
+    db.execute(
+        update(Store)
+        .where(Store.id.in_(store_ids), Store.search_id.is_(None))
+        .values(search_id=search_id)
+        .execution_options(synchronize_session=False)
+    )
@@ -91,7 +91,7 @@ function App() {
   const fetchSavedSearches = async () => {
     setSavedLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/analytics/cached-searches`);
+      const response = await fetch(`${API_BASE_URL}/analytics/cached-searches?summary=true&limit=1000`);
       if (response.ok) {
         const data = await response.json();
         setSavedSearches(data);
@@ -3,16 +3,22 @@
 Script to check Google Places API usage and limits
 """
 
-import requests
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+import api_usage
+from google_client import get_client
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 def check_api_usage():
     """Check current API usage by making a test request and checking headers"""
@@ -34,7 +40,7 @@ def check_api_usage():
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = google.post('text_search', url, headers=headers, json=payload)
         
         print(f"Response Status: {response.status_code}")
         
@@ -108,32 +114,50 @@ def check_google_cloud_console_info():
     
     print("\n7. Check 'Reports' for detailed usage analytics")
 
-def estimate_usage_for_usa_script():
-    """Estimate API usage for the USA script"""
+def report_metered_usage(days=7):
+    """Report Google API calls metered by the backend and crawl scripts"""
     
     print("\n" + "=" * 50)
-    print("ESTIMATED API USAGE FOR USA SCRIPT:")
+    print(f"METERED API USAGE (LAST {days} DAYS):")
     print("=" * 50)
     
-    cities = 500
-    pages_per_city = 3
-    requests_per_page = 1
-    
-    total_requests = cities * pages_per_city * requests_per_page
-    
-    print(f"Cities to search: {cities}")
-    print(f"Pages per city: {pages_per_city}")
-    print(f"Total API requests needed: {total_requests:,}")
-    
-    print(f"\nTime estimate (with 2-second delays between pages):")
-    print(f"  - API calls: {total_requests:,}")
-    print(f"  - Delays: ~{total_requests * 2 / 60:.1f} minutes")
-    print(f"  - Total runtime: ~{total_requests * 2 / 3600:.1f} hours")
-    
-    print(f"\n⚠️  WARNING: This will use {total_requests:,} API requests!")
-    print("   Make sure you have sufficient quota available.")
+    SessionLocal = None
+    if os.getenv('DATABASE_URL'):
+        try:
+            from database import SessionLocal
+        except ImportError as e:
+            print(f"Recorded usage unavailable: {e}")
+    else:
+        print("DATABASE_URL is not set")
+    
+    if SessionLocal is None:
+        # Without the database only this process's calls are known
+        summary = api_usage.process_meter.summary()
+        print("Showing this run only")
+        print(f"  Calls: {summary['calls']} {summary['by_sku']}")
+        return
+    
+    db = SessionLocal()
+    try:
+        usage = api_usage.usage_by_day(db, days)
+    finally:
+        db.close()
+    
+    if not usage:
+        print("No calls recorded")
+        return
+    for entry in usage:
+        print(f"\n{entry['day']}: {entry['total']:,} calls")
+        for sku, calls in sorted(entry['by_sku'].items()):
+            print(f"  {sku}: {calls:,}")
+        for source, calls in sorted(entry['by_source'].items()):
+            print(f"  from {source}: {calls:,}")
+    
+    if api_usage.API_DAILY_BUDGET:
+        today = usage[0]['total'] if usage[0]['day'] == datetime.utcnow().date().isoformat() else 0
+        print(f"\nDaily budget: {today:,} of {api_usage.API_DAILY_BUDGET:,} calls used today")
 
 if __name__ == "__main__":
     check_api_usage()
     check_google_cloud_console_info()
-    estimate_usage_for_usa_script() 
\ No newline at end of file
+    report_metered_usage() 
\ No newline at end of file
@@ -1,18 +1,33 @@
-import requests
 import os
 import json
 import time
 from dotenv import load_dotenv
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client, pagetoken_delays
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
 PLACES_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
 DETAILS_URL = 'https://maps.googleapis.com/maps/api/place/details/json'
 
 RADIUS = 10000  # 10 km
+
+# Place Details are shared with the backend's cache (place_details_cache) when DATABASE_URL is set
+details_session = None
+if os.getenv('DATABASE_URL'):
+    try:
+        import details_cache
+        from database import SessionLocal as details_session
+    except ImportError as e:
+        print(f"Place Details cache disabled: {e}")
 TYPE = 'hardware_store'
 
 # Known contact information for major hardware chains
@@ -55,7 +70,7 @@ def geocode_location(location):
         'address': location,
         'key': API_KEY
     }
-    resp = requests.get(GEOCODE_URL, params=params)
+    resp = google.get('geocode', GEOCODE_URL, params=params)
     data = resp.json()
     if data['status'] == 'OK' and data['results']:
         loc = data['results'][0]['geometry']['location']
@@ -73,31 +88,40 @@ def find_hardware_stores(lat, lng):
         'type': TYPE,
         'key': API_KEY
     }
-    next_page_token = None
+    data = google.get('nearby', PLACES_URL, params=params).json()
     while True:
-        if next_page_token:
-            params['pagetoken'] = next_page_token
-            time.sleep(2)  # Google requires a short delay before using next_page_token
-        resp = requests.get(PLACES_URL, params=params)
-        data = resp.json()
         results = data.get('results', [])
         all_results.extend(results)
         next_page_token = data.get('next_page_token')
         if not next_page_token:
             break
+        params['pagetoken'] = next_page_token
+        # A new next_page_token takes a moment to become valid (INVALID_REQUEST until then)
+        for delay in pagetoken_delays():
+            time.sleep(delay)
+            data = google.get('nearby', PLACES_URL, params=params).json()
+            if data.get('status') != 'INVALID_REQUEST':
+                break
     return all_results
 
 
-def get_place_details(place_id):
-    # Request all available fields for better data
+# Request all available fields for better data
+DETAILS_FIELDS = 'name,formatted_phone_number,website,formatted_address,email,types,opening_hours,price_level,rating,user_ratings_total,international_phone_number'
+
+def fetch_place_details(place_id):
     params = {
         'place_id': place_id,
-        'fields': 'name,formatted_phone_number,website,formatted_address,email,types,opening_hours,price_level,rating,user_ratings_total,international_phone_number',
+        'fields': DETAILS_FIELDS,
         'key': API_KEY
     }
-    resp = requests.get(DETAILS_URL, params=params)
+    resp = google.get('details', DETAILS_URL, params=params)
     return resp.json().get('result', {})
 
+def get_place_details(place_id):
+    if details_session is None:
+        return fetch_place_details(place_id)
+    return details_cache.get_or_fetch(details_session, place_id, DETAILS_FIELDS, lambda: fetch_place_details(place_id))
+
 
 def get_contact_info(name, details):
     """Get contact information from API or known chains"""
@@ -150,8 +174,12 @@ def main():
         name = store.get('name', 'N/A')
         place_id = store.get('place_id')
         
-        # Get detailed information
-        details = get_place_details(place_id)
+        # Get detailed information; once the API budget is spent, save the stores done so far
+        try:
+            details = get_place_details(place_id)
+        except BudgetExceeded as e:
+            print(f"Stopping after {len(simplified_results)} of {len(stores)} stores: {e}")
+            break
         
         # Get contact information
         contact_info = get_contact_info(name, details)
@@ -205,4 +233,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    try:
+        main()
+    except BudgetExceeded as e:
+        # Spent before any store was looked up: nothing to save
+        print(f"Stopping: {e}") 
\ No newline at end of file
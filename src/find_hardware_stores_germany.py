@@ -3,18 +3,24 @@
 Script to find hardware stores across Germany using Google Places API with pagination
 """
 
-import requests
 import json
 import time
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 # Get current timestamp for file naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -158,7 +164,7 @@ def search_location_with_pagination(lat, lng, location_name):
             payload["pageToken"] = next_page_token
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = google.post('nearby', url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -213,6 +219,8 @@ def search_location_with_pagination(lat, lng, location_name):
                     print(f"  {error_data['error'].get('message', 'Unknown error')}")
                 break
                 
+        except BudgetExceeded:
+            raise
         except Exception as e:
             print(f"Error searching in {location_name}: {str(e)}")
             break
@@ -225,8 +233,12 @@ for coords, location_name in GERMANY_LOCATIONS:
     # Parse coordinates
     lat, lng = map(float, coords.split(','))
     
-    # Search with pagination
-    location_stores = search_location_with_pagination(lat, lng, location_name)
+    # Search with pagination; once the API budget is spent, stop and save what was found
+    try:
+        location_stores = search_location_with_pagination(lat, lng, location_name)
+    except BudgetExceeded as e:
+        print(f"\n⏸️  Stopping: {e}")
+        break
     total_found = len(location_stores)
     
     print(f"Total unique stores found in {location_name}: {total_found}")
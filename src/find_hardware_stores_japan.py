@@ -3,7 +3,6 @@
 Script to find hardware stores across Japan using Google Places API with pagination and email search
 """
 
-import requests
 import json
 import time
 import os
@@ -11,12 +10,28 @@ import csv
 import re
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
+
+# Place Details are shared with the backend's cache (place_details_cache) when DATABASE_URL is set
+details_session = None
+if os.getenv('DATABASE_URL'):
+    try:
+        import details_cache
+        from database import SessionLocal as details_session
+    except ImportError as e:
+        print(f"Place Details cache disabled: {e}")
 
 # Get current timestamp for file naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -290,24 +305,34 @@ print(f"🏪 Already found: {len(all_stores)} stores")
 # Initialize CSV file
 initialize_csv()
 
-def get_store_details(place_id):
-    """Get detailed information for a store including potential email"""
+DETAILS_FIELD_MASK = 'id,displayName,formattedAddress,nationalPhoneNumber,websiteUri,rating,userRatingCount,types,editorialSummary,priceLevel,currentOpeningHours,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,id,internationalPhoneNumber,formattedAddress,addressComponents,plusCode,location,viewport,rating,googleMapsUri,regularOpeningHours,currentOpeningHours,secondaryOpeningHours,editorialSummary,priceLevel,attributions,userRatingCount,photos,reviews,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,id,internationalPhoneNumber,formattedAddress,addressComponents,plusCode,location,viewport,rating,googleMapsUri,regularOpeningHours,currentOpeningHours,secondaryOpeningHours,editorialSummary,priceLevel,attributions,userRatingCount,photos,reviews,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress'
+
+def fetch_store_details(place_id):
     url = f"https://places.googleapis.com/v1/places/{place_id}"
     headers = {
         'X-Goog-Api-Key': API_KEY,
-        'X-Goog-FieldMask': 'id,displayName,formattedAddress,nationalPhoneNumber,websiteUri,rating,userRatingCount,types,editorialSummary,priceLevel,currentOpeningHours,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,id,internationalPhoneNumber,formattedAddress,addressComponents,plusCode,location,viewport,rating,googleMapsUri,regularOpeningHours,currentOpeningHours,secondaryOpeningHours,editorialSummary,priceLevel,attributions,userRatingCount,photos,reviews,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,id,internationalPhoneNumber,formattedAddress,addressComponents,plusCode,location,viewport,rating,googleMapsUri,regularOpeningHours,currentOpeningHours,secondaryOpeningHours,editorialSummary,priceLevel,attributions,userRatingCount,photos,reviews,types,primaryType,primaryTypeDisplayName,shortFormattedAddress,delivery,servesDinner,servesLunch,servesBreakfast,servesBeer,servesWine,servesCocktails,servesDessert,servesCoffee,outdoorSeating,liveMusic,kidsMenu,menuForChildren,reservable,takeout,dineIn,deliveryOptions,subDeliveryOptions,accessibilityOptions,atmosphere,paymentOptions,services,highlights,popularity,priceLevel,rating,userRatingCount,photos,reviews,utcOffsetMinutes,viewport,location,iconMaskBaseUri,iconBackgroundColor,types,primaryType,primaryTypeDisplayName,shortFormattedAddress'
+        'X-Goog-FieldMask': DETAILS_FIELD_MASK
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = google.get('details', url, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
             return None
+    except BudgetExceeded:
+        # Not a lookup failure: stop the crawl instead of saving the store without details
+        raise
     except Exception as e:
         print(f"Error getting details for {place_id}: {str(e)}")
         return None
 
+def get_store_details(place_id):
+    """Get detailed information for a store including potential email"""
+    if details_session is None:
+        return fetch_store_details(place_id)
+    return details_cache.get_or_fetch(details_session, place_id, DETAILS_FIELD_MASK, lambda: fetch_store_details(place_id))
+
 def search_location_with_pagination(lat, lng, location_name):
     """Search a location with pagination to get up to 60 results"""
     location_stores = []
@@ -342,7 +367,7 @@ def search_location_with_pagination(lat, lng, location_name):
             payload["pageToken"] = next_page_token
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = google.post('nearby', url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -357,10 +382,10 @@ def search_location_with_pagination(lat, lng, location_name):
                     
                     # Avoid duplicates
                     if place_id not in seen_place_ids:
-                        seen_place_ids.add(place_id)
-                        
-                        # Get detailed information including potential email
+                        # Get detailed information including potential email; the place
+                        # is only marked seen once they are in, so a stopped run retries it
                         details = get_store_details(place_id)
+                        seen_place_ids.add(place_id)
                         if details:
                             place.update(details)
                         
@@ -416,6 +441,9 @@ def search_location_with_pagination(lat, lng, location_name):
                     print(f"  {error_data['error'].get('message', 'Unknown error')}")
                 break
                 
+        except BudgetExceeded:
+            # The location isn't finished: leave it for the next run
+            raise
         except Exception as e:
             print(f"Error searching in {location_name}: {str(e)}")
             break
@@ -448,6 +476,13 @@ except KeyboardInterrupt:
     print(f"📊 Found {len(all_stores)} stores so far")
     print(f"📄 CSV file saved to: {CSV_FILE}")
     exit(0)
+except BudgetExceeded as e:
+    print(f"\n⚠️ Stopping at location {i+1}/{len(JAPAN_LOCATIONS)}: {e}")
+    # Resume at this location; stores already found in it are skipped as seen
+    save_progress(i, completed_locations, all_stores, seen_place_ids)
+    print(f"💾 Progress saved. Resume once the budget allows (API_CRAWL_BUDGET / API_DAILY_BUDGET).")
+    print(f"📊 Found {len(all_stores)} stores so far")
+    exit(0)
 
 print(f"\n" + "=" * 60)
 print(f"TOTAL UNIQUE HARDWARE STORES FOUND: {len(all_stores)}")
@@ -43,12 +43,19 @@ import re
 from urllib.parse import urljoin, urlparse
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 # Get current timestamp for file naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -565,7 +572,7 @@ def search_location_with_pagination(lat, lng, location_name, progress):
             payload["pageToken"] = next_page_token
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = google.post('nearby', url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -643,6 +650,9 @@ def search_location_with_pagination(lat, lng, location_name, progress):
                     print(f"  {error_data['error'].get('message', 'Unknown error')}")
                 break
                 
+        except BudgetExceeded:
+            # The location isn't finished: leave it for the next run
+            raise
         except Exception as e:
             print(f"Error searching in {location_name}: {str(e)}")
             break
@@ -698,6 +708,13 @@ def main():
         print(f"📊 Found {len(progress['all_stores'])} stores so far")
         print(f"📄 CSV file saved to: {CSV_FILE}")
         exit(0)
+    except BudgetExceeded as e:
+        print(f"\n⚠️ Stopping at {location_name}: {e}")
+        # Not marked completed: the next run searches it again, skipping stores already seen
+        save_progress(progress)
+        print(f"💾 Progress saved. Resume once the budget allows (API_CRAWL_BUDGET / API_DAILY_BUDGET).")
+        print(f"📊 Found {len(progress['all_stores'])} stores so far")
+        exit(0)
     
     print(f"\n" + "=" * 60)
     print(f"TOTAL UNIQUE HARDWARE STORES FOUND: {len(progress['all_stores'])}")
@@ -4,19 +4,25 @@ Script to find hardware stores across the United States using Google Places API
 Supports incremental saving and resume functionality
 """
 
-import requests
 import json
 import time
 import os
 import csv
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 # Get current timestamp for file naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -347,7 +353,7 @@ def search_location_with_pagination(city_name, progress):
             payload["pageToken"] = next_page_token
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = google.post('text_search', url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
@@ -409,6 +415,9 @@ def search_location_with_pagination(city_name, progress):
                     print(f"  {error_data['error'].get('message', 'Unknown error')}")
                 break
                 
+        except BudgetExceeded:
+            # The city isn't finished: leave it for the next run
+            raise
         except Exception as e:
             print(f"Error searching in {city_name}: {str(e)}")
             break
@@ -473,6 +482,12 @@ def main():
         save_progress(progress)
         print(f"📊 Progress saved. You can resume later by running the script again.")
         return
+    except BudgetExceeded as e:
+        print(f"\n⏸️  Stopping: {e}")
+        print(f"💾 Saving current progress...")
+        save_progress(progress)
+        print(f"📊 Progress saved. Resume once the budget allows (API_CRAWL_BUDGET / API_DAILY_BUDGET).")
+        return
     
     # Final save
     save_progress(progress)
@@ -3,18 +3,24 @@
 Script to find hardware stores across Washington State using Google Places API
 """
 
-import requests
 import json
 import time
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
+from api_usage import BudgetExceeded
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key from environment variable
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 # Get current timestamp for file naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -80,7 +86,7 @@ for coords, location_name in WASHINGTON_LOCATIONS:
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = google.post('nearby', url, headers=headers, json=payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -124,6 +130,10 @@ for coords, location_name in WASHINGTON_LOCATIONS:
             if 'error' in error_data:
                 print(f"  {error_data['error'].get('message', 'Unknown error')}")
             
+    except BudgetExceeded as e:
+        # Stop and save what was found
+        print(f"\n⏸️  Stopping: {e}")
+        break
     except Exception as e:
         print(f"Error searching in {location_name}: {str(e)}")
     
@@ -1,13 +1,18 @@
-import requests
 import json
 import os
 from dotenv import load_dotenv
+import sys
+
+# Shared pooled Google client lives in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from google_client import get_client
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Test the API key
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+google = get_client()
 
 print("Testing Google Places API Key...")
 print("=" * 50)
@@ -23,7 +28,7 @@ params = {
 }
 
 try:
-    response = requests.get(url, params=params)
+    response = google.get('nearby', url, params=params)
     data = response.json()
     
     print(f"Status: {data.get('status')}")
@@ -58,7 +63,7 @@ payload = {
 }
 
 try:
-    response = requests.post(url, headers=headers, json=payload)
+    response = google.post('nearby', url, headers=headers, json=payload)
     print(f"Status Code: {response.status_code}")
     
     if response.status_code == 200: